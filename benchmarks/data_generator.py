@@ -0,0 +1,270 @@
+"""Deterministic synthetic data for benchmarks.
+
+The same seed and row count always produce the same rows, so numbers from
+different runs and machines can be compared.
+"""
+import os
+
+# Set before the repo modules are imported: keep benchmark runs out of the
+# production error_log and offline journal
+os.environ['TASSEN_ERROR_SINK'] = '0'
+os.environ.setdefault('TASSEN_OFFLINE_JOURNAL', 'benchmarks/offline_journal.db')
+os.environ.setdefault('TASSEN_OFFLINE_SNAPSHOT', 'benchmarks/offline_snapshot.db')
+
+import random
+import argparse
+from datetime import datetime, timedelta
+from database import DatabaseManager
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+BASE_DATE = datetime(2024, 1, 1)
+CHUNK_SIZE = 10000
+
+FIRST_NAMES = ['Anna', 'Ben', 'Clara', 'David', 'Emma', 'Felix', 'Greta', 'Hannes',
+               'Ida', 'Jonas', 'Klara', 'Lukas', 'Mia', 'Noah', 'Paula', 'Sophie']
+LAST_NAMES = ['Müller', 'Schmidt', 'Schneider', 'Fischer', 'Weber', 'Meyer', 'Wagner',
+              'Becker', 'Schulz', 'Hoffmann', 'Koch', 'Richter', 'Klein', 'Wolf']
+PRODUCTS = ['Tasse', 'Kaffeetasse', 'Emaille Becher', 'Thermobecher', 'T-Shirt',
+            'Hoodie', 'Kissen', 'Mousepad', 'Jutebeutel', 'Puzzle']
+COLORS = ['Weiss', 'Schwarz', 'Rot', 'Blau', 'Gruen', 'Gelb', 'Grau']
+SIZES = ['S', 'M', 'L', 'XL', '300ml', '450ml']
+SUPPLIERS = ['L-Shop', 'Prinequipment', 'Sublimation24', 'Textilgrosshandel']
+MANUFACTURERS = ['FOL', 'Orca', 'B&C', 'Stanley']
+
+# Row counts relative to the number of cup_orders
+SCALE = {
+    'customers': 0.1,
+    'charges': 0.001,
+    'files': 0.5,
+}
+
+
+def table_schemas(use_sqlite):
+    id_column = 'INTEGER PRIMARY KEY AUTOINCREMENT' if use_sqlite else 'BIGSERIAL PRIMARY KEY'
+    return {
+        'customers': '''
+            CREATE TABLE IF NOT EXISTS customers (
+                kundennummer TEXT PRIMARY KEY,
+                vorname TEXT,
+                nachname TEXT,
+                bestellnummer TEXT UNIQUE,
+                quadratmeter REAL,
+                dateien INTEGER,
+                barcode TEXT
+            )
+        ''',
+        'charges': '''
+            CREATE TABLE IF NOT EXISTS charges (
+                internal_id TEXT PRIMARY KEY,
+                product_name TEXT NOT NULL,
+                supplier_name TEXT,
+                color TEXT,
+                size TEXT,
+                manufacturer TEXT NOT NULL,
+                external_id TEXT,
+                batch_number TEXT UNIQUE,
+                delivery_date TEXT NOT NULL,
+                amount INTEGER NOT NULL DEFAULT 0,
+                last_updated TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+        'cup_orders': f'''
+            CREATE TABLE IF NOT EXISTS cup_orders (
+                id {id_column},
+                kundennummer TEXT NOT NULL,
+                product_name TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                color TEXT,
+                size TEXT,
+                order_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+        'files': f'''
+            CREATE TABLE IF NOT EXISTS files (
+                id {id_column},
+                kunden_id TEXT,
+                dateiname TEXT,
+                breite REAL,
+                hoehe REAL,
+                anzahl INTEGER,
+                quadratmeter REAL,
+                gedruckt BOOLEAN DEFAULT FALSE
+            )
+        ''',
+    }
+
+
+class DataGenerator:
+    """Fills customers, charges, cup_orders and files with scaled synthetic data"""
+
+    def __init__(self, database, rows=10000, seed=42):
+        self.db = database
+        self.rows = rows
+        self.seed = seed
+
+    def counts(self):
+        counts = {table: max(10, int(self.rows * ratio)) for table, ratio in SCALE.items()}
+        counts['cup_orders'] = self.rows
+        return counts
+
+    def products(self):
+        """Distinct (product_name, color, size) combinations used by the generator"""
+        rng = random.Random(self.seed)
+        combos = [(p, c, s) for p in PRODUCTS for c in COLORS for s in SIZES]
+        rng.shuffle(combos)
+        count = self.counts()['charges']
+        # Several batches per product once the catalogue is exhausted
+        return [combos[i % len(combos)] for i in range(count)]
+
+    def customer_ids(self):
+        return [str(10000 + i) for i in range(self.counts()['customers'])]
+
+    def create_tables(self):
+        # Raw cursor: execute_query would rewrite the CURRENT_TIMESTAMP defaults
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        try:
+            for schema in table_schemas(self.db.use_sqlite).values():
+                cur.execute(schema)
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+
+    def truncate(self):
+        for table in ('files', 'cup_orders', 'charges', 'customers'):
+            self.db.execute_query(f"DELETE FROM {table}")
+
+    def generate(self):
+        """Recreate the full dataset; returns the row count per table"""
+        self.create_tables()
+        self.truncate()
+        counts = self.counts()
+        self._insert('customers', self._customers())
+        self._insert('charges', self._charges())
+        self._insert('cup_orders', self._cup_orders())
+        self._insert('files', self._files())
+        if self.db.use_sqlite:
+            self.db.execute_query("ANALYZE")
+        logger.info(f"Generated benchmark data (seed {self.seed}): {counts}")
+        return counts
+
+    def _customers(self):
+        rng = random.Random(self.seed + 1)
+        for i, kundennummer in enumerate(self.customer_ids()):
+            yield (
+                kundennummer,
+                rng.choice(FIRST_NAMES),
+                rng.choice(LAST_NAMES),
+                f"PRFX-{BASE_DATE.year}{i + 1:07d}",
+                round(rng.uniform(0.1, 20.0), 3),
+                rng.randint(0, 20),
+                None,
+            )
+
+    def _charges(self):
+        rng = random.Random(self.seed + 2)
+        for i, (product_name, color, size) in enumerate(self.products()):
+            delivery = BASE_DATE + timedelta(days=rng.randint(0, 700))
+            yield (
+                f"INT-{i + 1:08d}",
+                product_name,
+                rng.choice(SUPPLIERS),
+                color,
+                size,
+                rng.choice(MANUFACTURERS),
+                f"EXT{rng.randint(1000, 99999)}",
+                f"BATCH-{delivery:%Y%m%d}-{i + 1:06d}",
+                delivery.strftime('%Y-%m-%d'),
+                # Plenty of stock so save_order benchmarks do not run dry
+                rng.randint(10 ** 6, 10 ** 7),
+                delivery.strftime('%Y-%m-%d %H:%M:%S'),
+            )
+
+    def _cup_orders(self):
+        rng = random.Random(self.seed + 3)
+        customers = self.customer_ids()
+        products = self.products()
+        for _ in range(self.rows):
+            product_name, color, size = rng.choice(products)
+            order_date = BASE_DATE + timedelta(seconds=rng.randint(0, 3 * 365 * 86400))
+            yield (
+                rng.choice(customers),
+                product_name,
+                rng.randint(1, 50),
+                color,
+                size,
+                order_date.strftime('%Y-%m-%d %H:%M:%S'),
+            )
+
+    def _files(self):
+        rng = random.Random(self.seed + 4)
+        customers = self.customer_ids()
+        for i in range(self.counts()['files']):
+            breite = round(rng.uniform(5, 150), 1)
+            hoehe = round(rng.uniform(5, 200), 1)
+            anzahl = rng.randint(1, 10)
+            yield (
+                rng.choice(customers),
+                f"motiv_{i:08d}.{rng.choice(['pdf', 'tif', 'png'])}",
+                breite,
+                hoehe,
+                anzahl,
+                round(breite * hoehe / 10000 * anzahl, 3),
+                rng.random() < 0.8,
+            )
+
+    def _insert(self, table, rows):
+        columns = {
+            'customers': 'kundennummer, vorname, nachname, bestellnummer, quadratmeter, dateien, barcode',
+            'charges': ('internal_id, product_name, supplier_name, color, size, manufacturer, '
+                        'external_id, batch_number, delivery_date, amount, last_updated'),
+            'cup_orders': 'kundennummer, product_name, quantity, color, size, order_date',
+            'files': 'kunden_id, dateiname, breite, hoehe, anzahl, quadratmeter, gedruckt',
+        }[table]
+
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        try:
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= CHUNK_SIZE:
+                    self._write_chunk(cur, table, columns, chunk)
+                    chunk = []
+            if chunk:
+                self._write_chunk(cur, table, columns, chunk)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error generating {table}: {e}")
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+    def _write_chunk(self, cur, table, columns, chunk):
+        if self.db.use_sqlite:
+            placeholders = ', '.join('?' * len(chunk[0]))
+            cur.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", chunk)
+        else:
+            from psycopg2.extras import execute_values
+            execute_values(cur, f"INSERT INTO {table} ({columns}) VALUES %s", chunk, page_size=CHUNK_SIZE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic benchmark data")
+    parser.add_argument('--rows', type=int, default=10000, help="number of cup_orders rows")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sqlite', default='benchmarks/bench.db', help="SQLite target file")
+    parser.add_argument('--pg-dsn', help="PostgreSQL DSN; overrides --sqlite")
+    args = parser.parse_args()
+
+    database = DatabaseManager(db_url=args.pg_dsn, sqlite_path=None if args.pg_dsn else args.sqlite)
+    print(DataGenerator(database, rows=args.rows, seed=args.seed).generate())
+
+
+if __name__ == "__main__":
+    main()
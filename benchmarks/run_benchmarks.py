@@ -0,0 +1,196 @@
+"""End-to-end benchmarks for the order code paths.
+
+Usage:
+    python -m benchmarks.run_benchmarks --rows 100000
+    python -m benchmarks.run_benchmarks --pg-dsn postgresql://localhost/bench
+    python -m benchmarks.run_benchmarks --output run.json --baseline last.json
+
+With --baseline the run exits non-zero if any benchmark lost more than
+--tolerance of its throughput or p95 latency.
+"""
+import os
+
+# Set before the repo modules are imported: keep benchmark runs out of the
+# production error_log and offline journal
+os.environ['TASSEN_ERROR_SINK'] = '0'
+os.environ.setdefault('TASSEN_OFFLINE_JOURNAL', 'benchmarks/offline_journal.db')
+os.environ.setdefault('TASSEN_OFFLINE_SNAPSHOT', 'benchmarks/offline_snapshot.db')
+
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from database import DatabaseManager
+from utils.logger import setup_logger
+from utils.order_service import OrderService
+from benchmarks.data_generator import DataGenerator, FIRST_NAMES, LAST_NAMES
+
+logger = setup_logger()
+
+MEMORY_ITERATIONS = 20      # calls traced by tracemalloc for peak_kib
+
+SEARCH_QUERY = """
+    SELECT kundennummer, vorname, nachname, bestellnummer
+    FROM customers
+    WHERE kundennummer ILIKE %s OR vorname ILIKE %s OR nachname ILIKE %s
+    ORDER BY kundennummer
+    LIMIT 100
+"""
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class BenchmarkRunner:
+    """Runs each benchmark case and records throughput, latency and peak memory"""
+
+    def __init__(self, database, generator, iterations=200, seed=42):
+        self.db = database
+        self.service = OrderService(database, offline=False)
+        self.generator = generator
+        self.iterations = iterations
+        self.rng = random.Random(seed)
+        self.products = generator.products()
+        self.customers = generator.customer_ids()
+
+    def cases(self):
+        return {
+            'load_products': self.service.load_products,
+            'check_stock': self._check_stock,
+            'save_order': self._save_order,
+            'load_customer': self._load_customer,
+            'generate_order_number': self.service.generate_order_number,
+            'search_customers': self._search_customers,
+        }
+
+    def _check_stock(self):
+        product_name, color, size = self.rng.choice(self.products)
+        return self.service.check_stock(product_name, self.rng.randint(1, 10), color, size)
+
+    def _save_order(self):
+        items = [(p, self.rng.randint(1, 3), c, s)
+                 for p, c, s in self.rng.sample(self.products, min(3, len(self.products)))]
+        return self.service.save_order(self.rng.choice(self.customers), items)
+
+    def _load_customer(self):
+        return self.service.load_customer(self.rng.choice(self.customers))
+
+    def _search_customers(self):
+        term = f"%{self.rng.choice(FIRST_NAMES + LAST_NAMES)[:4]}%"
+        return self.db.execute_query(SEARCH_QUERY, (term, term, term), fetch=True)
+
+    def run_case(self, func):
+        # One warm-up call so connection setup and page cache are not measured
+        func()
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(self.iterations):
+            t0 = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - started
+
+        # tracemalloc slows every allocation down; measure memory in a separate, shorter pass
+        tracemalloc.start()
+        for _ in range(min(self.iterations, MEMORY_ITERATIONS)):
+            func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        latencies.sort()
+        return {
+            'iterations': self.iterations,
+            'ops_per_sec': round(self.iterations / elapsed, 2) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'max_ms': round(latencies[-1] * 1000, 3),
+            'peak_kib': round(peak / 1024, 1),
+        }
+
+    def run(self, only=None):
+        results = {}
+        for name, func in self.cases().items():
+            if only and name not in only:
+                continue
+            results[name] = self.run_case(func)
+            logger.info(f"Benchmark {name}: {results[name]}")
+        return results
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of human readable regressions against a baseline run"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if current['ops_per_sec'] < previous['ops_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: {current['ops_per_sec']} ops/s (was {previous['ops_per_sec']})")
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']} ms (was {previous['p95_ms']})")
+    return regressions
+
+
+def print_table(results):
+    header = f"{'benchmark':<24}{'ops/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'peak KiB':>12}"
+    print(header)
+    print('-' * len(header))
+    for name, r in results.items():
+        print(f"{name:<24}{r['ops_per_sec']:>12}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['p99_ms']:>10}{r['max_ms']:>10}{r['peak_kib']:>12}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run end-to-end order benchmarks")
+    parser.add_argument('--rows', type=int, default=10000, help="cup_orders rows (10k to 10M)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--sqlite', default='benchmarks/bench.db')
+    parser.add_argument('--pg-dsn', help="benchmark a local PostgreSQL instead of SQLite")
+    parser.add_argument('--reuse', action='store_true', help="skip data generation")
+    parser.add_argument('--only', nargs='*', help="run only the named benchmarks")
+    parser.add_argument('--output', help="write results as JSON")
+    parser.add_argument('--baseline', help="JSON results of a previous run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    database = DatabaseManager(db_url=args.pg_dsn, sqlite_path=None if args.pg_dsn else args.sqlite)
+    generator = DataGenerator(database, rows=args.rows, seed=args.seed)
+    if not args.reuse:
+        started = time.perf_counter()
+        generator.generate()
+        print(f"Generated {args.rows} orders in {time.perf_counter() - started:.1f}s")
+
+    results = BenchmarkRunner(database, generator, args.iterations, args.seed).run(args.only)
+    print_table(results)
+
+    report = {
+        'backend': 'postgresql' if args.pg_dsn else 'sqlite',
+        'rows': args.rows,
+        'seed': args.seed,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f).get('results', {})
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,13 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import os
-from datetime import datetime
 import logging
-from database import db
-from utils.logger import setup_logger
-from utils.barcode_handler import BarcodeHandler
-from utils.pdf_generator import PDFGenerator
 from config import WINDOW_SIZES, NAS_BASE_PATH
 
-logger = setup_logger()
-barcode_handler = BarcodeHandler()
+# The preview workers are spawned and re-import this module as __mp_main__,
+# so importing it must not open the database or start the logging pipeline.
+# Services are imported when an OrderApp is created.
+logger = logging.getLogger('bestellprogramm')
 
 class OrderApp:
     def __init__(self, parent_frame=None):
@@ -19,30 +16,17 @@ class OrderApp:
             self.root.title("Bestellverwaltung - Kundendaten")
             self.root.geometry(WINDOW_SIZES['bestellprogramm'])
 
+        from utils.logger import setup_logger
+        from utils.order_service import order_service
+        from utils.barcode_handler import BarcodeHandler
+        from utils.preview_cache import PreviewCache
+
+        setup_logger('bestellprogramm')
+        self.order_service = order_service
+        self.barcode_handler = BarcodeHandler()
+
         try:
-            # Überprüfe ob Tabelle existiert
-            test_query = """
-                SELECT EXISTS (
-                    SELECT FROM pg_tables
-                    WHERE schemaname = 'public' 
-                    AND tablename = 'customers'
-                );
-            """
-            result = db.execute_query(test_query, fetch=True)
-            if not result or not result[0][0]:  # Tabelle existiert nicht
-                # Erstelle Tabelle falls nicht vorhanden
-                create_table_query = '''
-                    CREATE TABLE IF NOT EXISTS customers (
-                        kundennummer VARCHAR PRIMARY KEY,
-                        vorname VARCHAR,
-                        nachname VARCHAR,
-                        bestellnummer VARCHAR UNIQUE,
-                        quadratmeter NUMERIC,
-                        dateien INTEGER,
-                        barcode VARCHAR
-                    )
-                '''
-                db.execute_query(create_table_query)
+            order_service.ensure_customer_table()
             logger.info("Database initialization successful")
         except Exception as e:
             logger.error(f"Database initialization error: {e}")
@@ -55,11 +39,16 @@ class OrderApp:
         self.last_name = tk.StringVar()
         self.order_number = tk.StringVar(value=self.generate_order_number())
         self.total_square_meters = tk.DoubleVar(value=0.0)
+        self.roll_usage = tk.StringVar(value="-")
         self.file_list = []
         self.file_dimensions = {}
+        self.previews = PreviewCache()
+        self._poll_job = None
 
         self.setup_ui()
         self.create_order_details_window()
+        self.root.bind('<Destroy>', self.on_destroy, add='+')
+        self.poll_previews()
 
     def setup_ui(self):
         # Configure root window grid
@@ -115,6 +104,10 @@ class OrderApp:
         ttk.Label(details_frame, text="Gesamt-Quadratmeter (QM):").pack(anchor="w")
         ttk.Label(details_frame, textvariable=self.total_square_meters).pack(anchor="w")
 
+        # Roll consumption from the nesting layout
+        ttk.Label(details_frame, text="Rollenverbrauch:").pack(anchor="w")
+        ttk.Label(details_frame, textvariable=self.roll_usage).pack(anchor="w")
+
         # File Upload Section
         ttk.Button(details_frame, text="Dateien Hochladen", command=self.upload_files).pack(pady=10)
         
@@ -129,18 +122,7 @@ class OrderApp:
                   command=self.generate_documents).pack(fill="x", padx=10, pady=5)
 
     def generate_order_number(self):
-        year = datetime.now().year
-        try:
-            query = "SELECT COUNT(*) FROM customers WHERE bestellnummer ILIKE %s"
-            result = db.execute_query(query, (f"PRFX-{year}%",), fetch=True)
-            if result and len(result) > 0 and result[0]:
-                count = result[0][0]
-            else:
-                count = 0
-            return f"PRFX-{year}{count+1:03d}"
-        except Exception as e:
-            logger.error(f"Error generating order number: {e}")
-            return f"PRFX-{year}001"  # Fallback
+        return self.order_service.generate_order_number()
 
     def auto_fill_customer(self, event=None):
         if self.customer_id.get():
@@ -148,49 +130,32 @@ class OrderApp:
 
     def save_customer(self):
         try:
-            query = """
-                INSERT INTO customers 
-                (kundennummer, vorname, nachname, bestellnummer, quadratmeter)
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (kundennummer) DO UPDATE
-                SET vorname = %s, nachname = %s, bestellnummer = %s, quadratmeter = %s
-            """
-            # Values needed twice for INSERT and UPDATE parts
-            params = (
-                self.customer_id.get(),
-                self.first_name.get(),
-                self.last_name.get(),
-                self.order_number.get(),
-                self.total_square_meters.get(),
-                # Repeat values for UPDATE part
-                self.first_name.get(),
-                self.last_name.get(),
-                self.order_number.get(),
-                self.total_square_meters.get()
-            )
-            db.execute_query(query, params)
-            logger.info(f"Customer saved: {self.customer_id.get()}")
+            self.order_service.save_customer({
+                'kundennummer': self.customer_id.get(),
+                'vorname': self.first_name.get(),
+                'nachname': self.last_name.get(),
+                'bestellnummer': self.order_number.get(),
+                'quadratmeter': self.total_square_meters.get(),
+            })
             messagebox.showinfo("Erfolg", "Kundendaten gespeichert")
         except Exception as e:
-            logger.error(f"Error saving customer: {e}")
+            logger.error(f"Error saving customer: {e}", extra={'kunden_id': self.customer_id.get()})
             messagebox.showerror("Fehler", "Fehler beim Speichern der Kundendaten")
 
     def load_customer(self):
         try:
-            query = "SELECT * FROM customers WHERE kundennummer = %s"
-            result = db.execute_query(query, (self.customer_id.get(),), fetch=True)
-            if result:
-                customer = result[0]
-                self.first_name.set(customer[1])
-                self.last_name.set(customer[2])
-                self.order_number.set(customer[3])
-                self.total_square_meters.set(customer[4] or 0.0)
+            customer = self.order_service.load_customer(self.customer_id.get())
+            if customer:
+                self.first_name.set(customer['vorname'])
+                self.last_name.set(customer['nachname'])
+                self.order_number.set(customer['bestellnummer'])
+                self.total_square_meters.set(customer['quadratmeter'])
                 logger.info(f"Customer loaded: {self.customer_id.get()}")
             else:
                 logger.warning(f"Customer not found: {self.customer_id.get()}")
                 messagebox.showwarning("Warnung", "Kunde nicht gefunden")
         except Exception as e:
-            logger.error(f"Error loading customer: {e}")
+            logger.error(f"Error loading customer: {e}", extra={'kunden_id': self.customer_id.get()})
             messagebox.showerror("Fehler", "Fehler beim Laden der Kundendaten")
 
     def create_customer_folder(self):
@@ -204,7 +169,7 @@ class OrderApp:
                 logger.info(f"Customer folder already exists: {folder_path}")
                 messagebox.showinfo("Info", "Kundenordner existiert bereits")
         except Exception as e:
-            logger.error(f"Error creating customer folder: {e}")
+            logger.error(f"Error creating customer folder: {e}", extra={'kunden_id': self.customer_id.get()})
             messagebox.showerror("Fehler", "Fehler beim Erstellen des Kundenordners")
 
     def upload_files(self):
@@ -219,6 +184,11 @@ class OrderApp:
         file_frame = ttk.Frame(self.file_list_frame)
         file_frame.pack(fill="x", pady=2)
 
+        # Placeholder until the thumbnail arrives from the preview workers
+        preview_label = ttk.Label(file_frame, text="…", width=12, anchor="center")
+        preview_label.pack(side="left", padx=5)
+        self.previews.request(file, lambda thumb, label=preview_label: self.show_preview(label, thumb))
+
         ttk.Label(file_frame, text=os.path.basename(file)).pack(side="left")
         
         width_var = tk.StringVar()
@@ -232,8 +202,39 @@ class OrderApp:
         self.file_dimensions[file] = (width_var, height_var, quantity_var)
         self.file_list.append(file)
 
+    def show_preview(self, label, thumb):
+        if not label.winfo_exists():
+            return
+        if thumb is None:
+            label.configure(text="Keine Vorschau")
+            return
+        try:
+            image = tk.PhotoImage(file=thumb)
+        except tk.TclError as e:
+            logger.warning(f"Error loading preview {thumb}: {e}")
+            label.configure(text="Keine Vorschau")
+            return
+        label.configure(image=image, text="", width=0)
+        label.image = image     # keep a reference, Tk does not
+
+    def poll_previews(self):
+        self.previews.dispatch_ready()
+        self._poll_job = self.root.after(100, self.poll_previews)
+
+    def on_destroy(self, event):
+        # <Destroy> also fires for the child widgets of a Toplevel
+        if event.widget is not self.root:
+            return
+        if self._poll_job is not None:
+            self.root.after_cancel(self._poll_job)
+            self._poll_job = None
+        self.previews.shutdown()
+
     def calculate_total(self):
+        from utils.nesting import Piece
+
         total = 0.0
+        pieces = []
         for file, (width_var, height_var, quantity_var) in self.file_dimensions.items():
             try:
                 width = float(width_var.get().replace(",", "."))
@@ -241,14 +242,29 @@ class OrderApp:
                 quantity = int(quantity_var.get())
                 area = (width * height / 10000) * quantity
                 total += area
+                pieces.extend([Piece(None, self.customer_id.get(), file, width, height)] * quantity)
             except ValueError:
                 logger.warning(f"Invalid dimensions for file: {file}")
                 messagebox.showwarning("Warnung", f"Ungültige Maße für {os.path.basename(file)}")
                 return
 
         self.total_square_meters.set(round(total, 3))
+        self.update_roll_usage(pieces)
         self.save_customer()
 
+    def update_roll_usage(self, pieces):
+        from utils.nesting import NestingEngine, ROLL_WIDTH_CM
+
+        try:
+            layout = NestingEngine().pack(pieces)
+            usage = f"{layout.metres:.2f} m bei {ROLL_WIDTH_CM:g} cm Rollenbreite ({layout.utilisation:.0%} Ausnutzung)"
+            if layout.unplaced:
+                usage += f", {len(layout.unplaced)} Motive zu breit"
+            self.roll_usage.set(usage)
+        except Exception as e:
+            logger.error(f"Error calculating roll usage: {e}")
+            self.roll_usage.set("-")
+
     def generate_documents(self):
         try:
             from utils.print_manager import PrintManager
@@ -274,13 +290,13 @@ class OrderApp:
             # Generate barcode
             barcode_data = f"{self.order_number.get()} QM:{self.total_square_meters.get()}"
             barcode_path = os.path.join(save_dir, f"{self.order_number.get()}_barcode.png")
-            if barcode_handler.generate_barcode(barcode_data, barcode_path):
+            if self.barcode_handler.generate_barcode(barcode_data, barcode_path):
                 logger.info(f"Documents generated for order: {self.order_number.get()}")
                 messagebox.showinfo("Erfolg", "Dokumente wurden erstellt")
             else:
                 raise Exception("Barcode generation failed")
         except Exception as e:
-            logger.error(f"Error generating documents: {e}")
+            logger.error(f"Error generating documents: {e}", extra={'kunden_id': self.customer_id.get()})
             messagebox.showerror("Fehler", "Fehler beim Erstellen der Dokumente")
 
     def new_order(self):
@@ -289,11 +305,15 @@ class OrderApp:
         self.last_name.set("")
         self.order_number.set(self.generate_order_number())
         self.total_square_meters.set(0.0)
+        self.roll_usage.set("-")
         self.file_list = []
         self.file_dimensions = {}
         for widget in self.file_list_frame.winfo_children():
             widget.destroy()
 
 if __name__ == "__main__":
+    from utils.ui_profiler import install_from_env as install_ui_profiler
+
+    install_ui_profiler()
     app = OrderApp()
     app.root.mainloop()
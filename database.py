@@ -1,44 +1,196 @@
 import os
-import logging
+import time
+import queue
 import sqlite3
+import threading
 import psycopg2
+from pathlib import Path
 from psycopg2.extras import DictCursor
-from datetime import datetime
 from config import DB_SCHEMA
+from utils.logger import setup_logger
+from utils.error_sink import install_error_sink
+
+logger = setup_logger()
+
+POOL_MAX_CONNECTIONS = 8
+# Callers include the Tk main loop: fail fast instead of freezing the window
+POOL_ACQUIRE_TIMEOUT = float(os.getenv('TASSEN_POOL_TIMEOUT', 5))
+PG_CONNECT_TIMEOUT = int(os.getenv('TASSEN_PG_CONNECT_TIMEOUT', 5))
+OFFLINE_MODE = os.getenv('TASSEN_OFFLINE_MODE', '1') == '1'
+MAX_READ_STALENESS = float(os.getenv('TASSEN_MAX_READ_STALENESS', 30))
+READ_CHECK_INTERVAL = 5     # seconds between replica lag checks
+ERROR_SINK = os.getenv('TASSEN_ERROR_SINK', '1') == '1'
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no pooled connection became free within the acquire timeout"""
+
+
+class PooledConnection:
+    """Connection proxy that goes back to its pool instead of closing"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+    def __del__(self):
+        # Callers that forget close() must not drain the pool
+        self.close()
+
+
+class ConnectionPool:
+    """Small thread-safe pool shared by every caller of DatabaseManager"""
+
+    def __init__(self, factory, maxconn=POOL_MAX_CONNECTIONS, timeout=POOL_ACQUIRE_TIMEOUT):
+        self.factory = factory
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def acquire(self, timeout=None):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.maxconn
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    conn = self.factory()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                timeout = self.timeout if timeout is None else timeout
+                try:
+                    conn = self._idle.get(timeout=timeout)
+                except queue.Empty:
+                    raise PoolTimeoutError(
+                        f"Keine freie Datenbankverbindung nach {timeout:g} s, bitte erneut versuchen") from None
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        try:
+            # Never hand out a connection with an open transaction
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        if not getattr(conn, 'closed', 0):
+            with self._lock:
+                # Checked against close() under the lock so nothing lands in a drained pool
+                if not self._closed:
+                    self._idle.put(conn)
+                    return
+        self._discard(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        """Close the idle connections; checked-out ones still count until released"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def close(self):
+        """Close the pool: idle connections now, checked-out ones when they are released"""
+        with self._lock:
+            self._closed = True
+        self.close_all()
+
 
 class DatabaseManager:
     SQLITE_DB_PATH = 'kunden.db'
     
-    def __init__(self):
-        self.db_url = os.getenv('DATABASE_URL')
+    def __init__(self, db_url=None, sqlite_path=None, replica_url=None, snapshot_path=None,
+                 max_staleness=MAX_READ_STALENESS):
+        # An explicit SQLite path wins over DATABASE_URL from the environment
+        self.db_url = db_url or (None if sqlite_path else os.getenv('DATABASE_URL'))
+        if sqlite_path:
+            self.SQLITE_DB_PATH = sqlite_path
         self.use_sqlite = not bool(self.db_url)
+        self.offline = False
+        # Set when the error_log sink could not be installed because we started offline
+        self.error_sink_pending = False
+
+        # Read routing: read_only queries go to a replica (PostgreSQL) or a
+        # backup-API snapshot (SQLite) while it is fresher than max_staleness
+        explicit = bool(db_url or sqlite_path)
+        if self.use_sqlite:
+            self.replica_url = None
+            self.snapshot_path = snapshot_path or (None if explicit else os.getenv('TASSEN_READ_SNAPSHOT'))
+        else:
+            self.replica_url = replica_url or (None if explicit else os.getenv('DATABASE_REPLICA_URL'))
+            self.snapshot_path = None
+        self.max_staleness = max_staleness
+        self._read_pool = None
+        self._read_usable = False
+        self._read_checked = 0.0
+        self._read_lock = threading.Lock()
+        self._snapshot_taken = None
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_stop = threading.Event()
         
         if self.use_sqlite:
-            logging.info("Using SQLite database")
+            logger.info("Using SQLite database")
             # Test SQLite connection
             try:
                 with sqlite3.connect(self.SQLITE_DB_PATH) as conn:
                     cursor = conn.cursor()
                     cursor.execute("PRAGMA foreign_keys = ON")
                     conn.commit()
-                    logging.info("Successfully connected to SQLite database")
+                    logger.info("Successfully connected to SQLite database")
             except Exception as e:
-                logging.error(f"SQLite connection error: {e}")
+                logger.error(f"SQLite connection error: {e}")
                 raise
         else:
-            logging.info("Using PostgreSQL database")
+            logger.info("Using PostgreSQL database")
             # Test PostgreSQL connection
             try:
-                with psycopg2.connect(self.db_url) as conn:
+                with psycopg2.connect(self.db_url, connect_timeout=PG_CONNECT_TIMEOUT) as conn:
                     conn.autocommit = True
                     with conn.cursor() as cursor:
                         cursor.execute("SELECT version();")
-                        logging.info("Successfully connected to PostgreSQL database")
+                        logger.info("Successfully connected to PostgreSQL database")
             except Exception as e:
-                logging.error(f"PostgreSQL connection error: {e}")
-                raise
+                logger.error(f"PostgreSQL connection error: {e}")
+                if not OFFLINE_MODE:
+                    raise
+                # Keep the apps usable; writes go to the offline journal
+                logger.warning("PostgreSQL unreachable, starting in offline mode")
+                self.offline = True
         
         self.conn = None
+        self._pool = None
         self.schema = {
             'charges': '''
                 CREATE TABLE IF NOT EXISTS charges (
@@ -63,13 +215,19 @@ class DatabaseManager:
                 # Enable foreign keys
                 cursor.execute("PRAGMA foreign_keys = ON")
                 conn.commit()
-                logging.info("Successfully connected to SQLite database")
+                logger.info("Successfully connected to SQLite database")
         except Exception as e:
-            logging.error(f"Database connection error: {e}")
+            logger.error(f"Database connection error: {e}")
             raise
-            
+
+        if self.offline:
+            return
         self._initialize_sequence_table()
         self.initialize_database()
+
+        if self.snapshot_path:
+            self.refresh_snapshot()
+            self.start_snapshot_refresher()
         
     def _initialize_sequence_table(self):
         """Initialize sequence table for SQLite autoincrement simulation"""
@@ -90,7 +248,7 @@ class DatabaseManager:
                     """)
                     conn.commit()
             except Exception as e:
-                logging.error(f"Error initializing sequence table: {e}")
+                logger.error(f"Error initializing sequence table: {e}")
                 raise
         else:
             try:
@@ -108,13 +266,13 @@ class DatabaseManager:
                     
                     if not exists:
                         cursor.execute("CREATE SEQUENCE batch_number_seq")
-                        logging.info("Created PostgreSQL sequence: batch_number_seq")
+                        logger.info("Created PostgreSQL sequence: batch_number_seq")
                     conn.commit()
                 finally:
                     cursor.close()
                     conn.close()
             except Exception as e:
-                logging.error(f"Error initializing PostgreSQL sequence: {e}")
+                logger.error(f"Error initializing PostgreSQL sequence: {e}")
                 raise
 
     def initialize_database(self):
@@ -133,7 +291,7 @@ class DatabaseManager:
                         if not exists:
                             # Use SQLite schema as is
                             cursor.execute(schema)
-                            logging.info(f"Created SQLite table: {table}")
+                            logger.info(f"Created SQLite table: {table}")
             else:
                 conn = self.get_connection()
                 try:
@@ -154,30 +312,230 @@ class DatabaseManager:
                             pg_schema = schema.replace('AUTOINCREMENT', 'GENERATED ALWAYS AS IDENTITY')
                             pg_schema = pg_schema.replace('CHARACTER SET utf8', '')
                             cursor.execute(pg_schema)
-                            logging.info(f"Created PostgreSQL table: {table}")
+                            logger.info(f"Created PostgreSQL table: {table}")
                     conn.commit()
                 finally:
                     cursor.close()
                     conn.close()
         except Exception as e:
-            logging.error(f"Database initialization error: {e}")
+            logger.error(f"Database initialization error: {e}")
             raise
 
-    def get_connection(self):
+    def enable_pool(self, maxconn=POOL_MAX_CONNECTIONS):
+        """Reuse connections across callers; conn.close() returns them to the pool"""
+        if self._pool is None:
+            self._pool = ConnectionPool(self._connect, maxconn)
+            logger.info(f"Connection pool enabled (max {maxconn} connections)")
+        if self._read_pool is None and self.has_read_target:
+            self._read_pool = ConnectionPool(self._connect_read, maxconn)
+        return self._pool
+
+    def close_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        if self._read_pool is not None:
+            self._read_pool.close()
+            self._read_pool = None
+
+    def get_connection(self, read_only=False):
         """Get a database connection with proper error handling"""
+        if read_only:
+            conn = self.get_read_connection()
+            if conn is not None:
+                return conn
+        if self._pool is not None:
+            return self._pool.acquire()
+        return self._connect()
+
+    def _connect(self):
         try:
             if self.use_sqlite:
-                conn = sqlite3.connect(self.SQLITE_DB_PATH)
+                # Pooled SQLite connections are handed between threads, one at a time
+                conn = sqlite3.connect(self.SQLITE_DB_PATH, check_same_thread=self._pool is None)
                 conn.row_factory = sqlite3.Row
                 return conn
             else:
-                conn = psycopg2.connect(self.db_url)
+                conn = psycopg2.connect(self.db_url, connect_timeout=PG_CONNECT_TIMEOUT)
                 conn.cursor_factory = DictCursor
                 return conn
         except Exception as e:
-            logging.error(f"Database connection error: {e}")
+            logger.error(f"Database connection error: {e}")
             raise
 
+    # ------------------------------------------------------------------
+    # Read routing
+    # ------------------------------------------------------------------
+    @property
+    def has_read_target(self):
+        return bool(self.replica_url or self.snapshot_path)
+
+    def _connect_read(self):
+        if self.use_sqlite:
+            uri = f"{Path(self.snapshot_path).absolute().as_uri()}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=30, check_same_thread=self._read_pool is None)
+            conn.row_factory = sqlite3.Row
+            return conn
+        conn = psycopg2.connect(self.replica_url, connect_timeout=PG_CONNECT_TIMEOUT)
+        conn.cursor_factory = DictCursor
+        conn.set_session(readonly=True)
+        return conn
+
+    def refresh_snapshot(self):
+        """Copy the SQLite database into the read snapshot via the backup API"""
+        with self._snapshot_lock:
+            started = time.time()
+            source = sqlite3.connect(self.SQLITE_DB_PATH, timeout=30)
+            target = sqlite3.connect(self.snapshot_path, timeout=30)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            # The snapshot is as old as the moment the copy started
+            self._snapshot_taken = started
+
+    def start_snapshot_refresher(self, interval=None):
+        interval = interval or max(1.0, self.max_staleness / 2)
+
+        def run():
+            while not self._snapshot_stop.wait(interval):
+                try:
+                    self.refresh_snapshot()
+                except Exception as e:
+                    logger.error(f"Error refreshing read snapshot: {e}")
+
+        threading.Thread(target=run, name='read-snapshot', daemon=True).start()
+
+    def stop_snapshot_refresher(self):
+        self._snapshot_stop.set()
+
+    def _replica_lag(self):
+        conn = psycopg2.connect(self.replica_url, connect_timeout=PG_CONNECT_TIMEOUT)
+        try:
+            with conn.cursor() as cursor:
+                # An idle primary has no replay lag even if the last replayed xact is old
+                cursor.execute('''
+                    SELECT CASE
+                        WHEN NOT pg_is_in_recovery() THEN 0
+                        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                    END
+                ''')
+                return float(cursor.fetchone()[0])
+        finally:
+            conn.close()
+
+    def read_lag(self):
+        """Seconds the read target is behind the primary (None if unknown)"""
+        if self.snapshot_path:
+            return None if self._snapshot_taken is None else time.time() - self._snapshot_taken
+        if self.replica_url:
+            return self._replica_lag()
+        return None
+
+    def read_target_usable(self):
+        if not self.has_read_target:
+            return False
+        if self.snapshot_path:
+            lag = self.read_lag()
+            return lag is not None and lag <= self.max_staleness
+
+        with self._read_lock:
+            if time.time() - self._read_checked < READ_CHECK_INTERVAL:
+                return self._read_usable
+            self._read_checked = time.time()
+        try:
+            lag = self.read_lag()
+            usable = lag <= self.max_staleness
+            if not usable:
+                logger.warning(f"Read replica {lag:.1f}s behind, reading from primary")
+        except Exception as e:
+            logger.warning(f"Read replica unreachable, reading from primary: {e}")
+            usable = False
+        if usable and not self._read_usable:
+            logger.info("Routing read-only queries to the replica")
+        self._read_usable = usable
+        return usable
+
+    def get_read_connection(self):
+        """Connection to the replica / snapshot, or None if the primary must answer"""
+        if not self.read_target_usable():
+            return None
+        try:
+            if self._read_pool is not None:
+                return self._read_pool.acquire()
+            return self._connect_read()
+        except Exception as e:
+            self._read_failed(e)
+            return None
+
+    def _read_failed(self, error):
+        if self.replica_url and self.is_connection_error(error):
+            with self._read_lock:
+                self._read_usable = False
+                self._read_checked = time.time()
+            if self._read_pool is not None:
+                self._read_pool.close_all()
+            logger.warning(f"Read replica failed, reading from primary: {error}")
+        else:
+            # e.g. a table the snapshot does not have yet
+            logger.info(f"Read-only query failed on the read target, retrying on primary: {error}")
+
+    def is_connection_error(self, error):
+        """True if the error means PostgreSQL is unreachable rather than a bad query"""
+        return not self.use_sqlite and isinstance(
+            error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+    def set_offline(self):
+        if self.use_sqlite or self.offline:
+            return
+        logger.warning("PostgreSQL connection lost, switching to offline mode")
+        self.offline = True
+        if self._pool is not None:
+            # Idle connections are dead after an outage
+            self._pool.close_all()
+
+    def try_reconnect(self):
+        """Leave offline mode once PostgreSQL answers again; returns True when online"""
+        if not self.offline:
+            return True
+        try:
+            conn = psycopg2.connect(self.db_url, connect_timeout=PG_CONNECT_TIMEOUT)
+            conn.close()
+            self._initialize_sequence_table()
+            self.initialize_database()
+        except Exception:
+            return False
+        self.offline = False
+        logger.info("PostgreSQL reachable again, leaving offline mode")
+        if self.error_sink_pending:
+            try:
+                install_error_sink(self)
+                self.error_sink_pending = False
+            except Exception as e:
+                logger.error(f"Error installing error_log sink: {e}")
+        return True
+
+    def get_columns(self, table):
+        """Return the column names of a table"""
+        if self.use_sqlite:
+            rows = self.execute_query(f"PRAGMA table_info({table})", fetch=True)
+            return [row[1] for row in rows]
+        rows = self.execute_query("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = %s
+        """, (table,), fetch=True)
+        return [row[0] for row in rows]
+
+    def add_missing_columns(self, table, columns):
+        """Add columns given as {name: type} that the table does not have yet"""
+        existing = set(self.get_columns(table))
+        for name, column_type in columns.items():
+            if name not in existing:
+                self.execute_query(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+                logger.info(f"Added column {table}.{name}")
+
     def get_next_sequence_value(self, sequence_name):
         """Get next value for a sequence in SQLite"""
         if not self.use_sqlite:
@@ -196,38 +554,86 @@ class DatabaseManager:
                 conn.commit()
                 return result[0] if result else 1
         except Exception as e:
-            logging.error(f"Error getting sequence value: {e}")
+            logger.error(f"Error getting sequence value: {e}")
             raise
 
-    def execute_query(self, query, params=None, fetch=False, conn=None):
-        """Execute a query with proper transaction handling"""
+    def reserve_sequence_block(self, cursor, sequence_name, count, minimum=0):
+        """Reserve `count` sequence values inside the caller's transaction.
+
+        The sequence is first moved past `minimum` so values never collide
+        with ids that were assigned outside the sequence.
+        """
+        if count <= 0:
+            return []
+        if self.use_sqlite:
+            cursor.execute("""
+                UPDATE sequences
+                SET value = MAX(value, ?) + ?
+                WHERE name = ?
+                RETURNING value
+            """, (minimum, count, sequence_name))
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute("INSERT INTO sequences (name, value) VALUES (?, ?)",
+                               (sequence_name, minimum + count))
+                end = minimum + count
+            else:
+                end = row[0]
+            return list(range(end - count + 1, end + 1))
+
+        sequence = f"{sequence_name}_seq"
+        if minimum:
+            cursor.execute(f"SELECT setval('{sequence}', GREATEST(%s, (SELECT last_value FROM {sequence})))",
+                           (minimum,))
+        cursor.execute(f"SELECT nextval('{sequence}') FROM generate_series(1, %s)", (count,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def adapt_query(self, query):
+        """Translate placeholders and dialect differences for the active backend"""
+        if self.use_sqlite:
+            # Convert PostgreSQL placeholders to SQLite
+            query = query.replace('%s', '?')
+            query = query.replace('ILIKE', 'LIKE')
+            query = query.replace('NOW()', "datetime('now')")
+            query = query.replace('CURRENT_TIMESTAMP', "datetime('now')")
+            
+            # SQLite understands PostgreSQL-style upserts; only a bare
+            # ON CONFLICT without an action needs completing
+            upper_query = query.upper()
+            if 'ON CONFLICT' in upper_query and ' DO ' not in upper_query:
+                query = query.replace('ON CONFLICT', 'ON CONFLICT DO NOTHING')
+        else:
+            # Convert SQLite syntax to PostgreSQL if needed
+            query = query.replace('?', '%s')
+            query = query.replace("datetime('now')", 'NOW()')
+            
+            # Handle SQLite's AUTOINCREMENT
+            query = query.replace('AUTOINCREMENT', 'GENERATED ALWAYS AS IDENTITY')
+        return query
+
+    def execute_query(self, query, params=None, fetch=False, conn=None, read_only=False):
+        """Execute a query with proper transaction handling.
+
+        read_only=True lets the query run on the replica / snapshot; the
+        primary answers when the read target is stale or fails.
+        """
+        if read_only and conn is None:
+            read_conn = self.get_read_connection()
+            if read_conn is not None:
+                try:
+                    return self._execute(query, params, fetch, read_conn, True, log_errors=False)
+                except (psycopg2.Error, sqlite3.Error) as e:
+                    self._read_failed(e)
+
         connection_owner = conn is None
         conn = conn or self.get_connection()
+        return self._execute(query, params, fetch, conn, connection_owner)
+
+    def _execute(self, query, params, fetch, conn, connection_owner, log_errors=True):
         cursor = conn.cursor()
         
         try:
-            if self.use_sqlite:
-                # Convert PostgreSQL placeholders to SQLite
-                query = query.replace('%s', '?')
-                query = query.replace('ILIKE', 'LIKE')
-                query = query.replace('NOW()', "datetime('now')")
-                query = query.replace('CURRENT_TIMESTAMP', "datetime('now')")
-                
-                # Handle ON CONFLICT for SQLite
-                if 'ON CONFLICT' in query.upper():
-                    if 'DO UPDATE' in query.upper():
-                        # Convert to SQLite's INSERT OR REPLACE
-                        query = query.replace('ON CONFLICT', 'ON CONFLICT DO UPDATE SET')
-                    else:
-                        # Convert to SQLite's INSERT OR IGNORE
-                        query = query.replace('ON CONFLICT', 'ON CONFLICT DO NOTHING')
-            else:
-                # Convert SQLite syntax to PostgreSQL if needed
-                query = query.replace('?', '%s')
-                query = query.replace("datetime('now')", 'NOW()')
-                
-                # Handle SQLite's AUTOINCREMENT
-                query = query.replace('AUTOINCREMENT', 'GENERATED ALWAYS AS IDENTITY')
+            query = self.adapt_query(query)
             
             if params:
                 cursor.execute(query, params)
@@ -246,7 +652,8 @@ class DatabaseManager:
         except Exception as e:
             if connection_owner:
                 conn.rollback()
-            logging.error(f"Query execution error: {str(e)}\nQuery: {query}\nParams: {params}")
+            if log_errors:
+                logger.error(f"Query execution error: {str(e)}\nQuery: {query}\nParams: {params}")
             raise
         finally:
             cursor.close()
@@ -272,7 +679,17 @@ class DatabaseManager:
                 cursor.close()
                 conn.close()
         except Exception as e:
-            logging.error(f"Database bulk operation error: {e}")
+            logger.error(f"Database bulk operation error: {e}")
             raise
 
 db = DatabaseManager()
+
+if ERROR_SINK and db.offline:
+    # try_reconnect installs it once PostgreSQL is back
+    db.error_sink_pending = True
+elif ERROR_SINK:
+    try:
+        # Persist errors from every module into error_log
+        install_error_sink(db)
+    except Exception as e:
+        logger.error(f"Error installing error_log sink: {e}")
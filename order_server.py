@@ -0,0 +1,275 @@
+import os
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from utils.logger import setup_logger
+from utils.order_service import order_service, OrderValidationError
+
+logger = setup_logger()
+
+API_HOST = os.getenv('ORDER_API_HOST', '127.0.0.1')
+API_PORT = int(os.getenv('ORDER_API_PORT', 8765))
+BATCH_SIZE = 200           # orders per database transaction
+BATCH_WAIT = 0.05          # seconds to wait for a batch to fill up
+QUEUE_SIZE = 2000          # pending orders before new requests get 503
+MAX_CONNECTIONS = 64       # concurrently handled HTTP connections
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+HTTP_STATUS = {
+    200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class OrderServer:
+    """Local HTTP/JSON intake for webshop and batch orders.
+
+    POST /orders accepts a single order object or an array of orders:
+        {"kundennummer": "10002",
+         "items": [{"product_name": "Tasse", "quantity": 2, "color": "Rot", "size": "M"}]}
+    GET /products lists the available stock, GET /customers/<id> a customer.
+
+    Orders are queued and written by one writer task in batches, so many
+    small requests share a transaction. When the queue is full the server
+    answers 503 with Retry-After instead of buffering without limit; a bulk
+    request larger than the whole queue is answered with 413. Orders may carry
+    an "idempotency_key", so a client can safely retry after a timeout.
+    """
+
+    def __init__(self, service=None, host=API_HOST, port=API_PORT,
+                 batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE):
+        self.service = service or order_service
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self._server = None
+        self._queue = None
+        self._writer_task = None
+        self._connections = None
+        # Single writer thread keeps batches ordered and avoids lock contention
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='order-writer')
+        self._read_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='order-reader')
+
+    async def start(self):
+        self._queue = asyncio.Queue(self.queue_size)
+        self._connections = asyncio.Semaphore(MAX_CONNECTIONS)
+        # sync_applied must exist before the writer checks idempotency keys
+        await asyncio.get_running_loop().run_in_executor(self._db_executor, self.service.ensure_order_table)
+        self._writer_task = asyncio.create_task(self._writer())
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        sockets = self._server.sockets or []
+        if sockets:
+            self.port = sockets[0].getsockname()[1]
+        logger.info(f"Order API listening on http://{self.host}:{self.port}")
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._queue is not None:
+            # Let queued orders reach the database before shutting down
+            await self._queue.join()
+        if self._writer_task:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+        self._db_executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+        logger.info("Order API stopped")
+
+    # ------------------------------------------------------------------
+    # Batch writer
+    # ------------------------------------------------------------------
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + BATCH_WAIT
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            orders = [order for order, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._db_executor, self.service.save_orders, orders)
+            except Exception as e:
+                results = [{'status': 'error', 'error': str(e)}] * len(batch)
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def submit_orders(self, orders):
+        """Validate, enqueue and await the results of a list of orders"""
+        loop = asyncio.get_running_loop()
+        results = [None] * len(orders)
+        pending = []
+
+        for index, order in enumerate(orders):
+            try:
+                self.service.validate_order(order)
+            except OrderValidationError as e:
+                results[index] = {'status': 'invalid', 'error': str(e)}
+            else:
+                pending.append(index)
+
+        # All-or-nothing admission keeps a bulk request from being half queued;
+        # a bulk that can never fit must not be retried, so it gets 413 not 503
+        if len(pending) > self._queue.maxsize:
+            raise HTTPError(413, f"Too many orders in one request (max {self._queue.maxsize})")
+        if self._queue.maxsize - self._queue.qsize() < len(pending):
+            raise HTTPError(503, "Order queue is full, retry later")
+
+        futures = []
+        for index in pending:
+            future = loop.create_future()
+            self._queue.put_nowait((orders[index], future))
+            futures.append((index, future))
+
+        for index, future in futures:
+            results[index] = await future
+        return results
+
+    # ------------------------------------------------------------------
+    # HTTP handling
+    # ------------------------------------------------------------------
+    async def _handle_client(self, reader, writer):
+        async with self._connections:
+            try:
+                while True:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    try:
+                        status, payload = await self._dispatch(method, path, body)
+                    except HTTPError as e:
+                        status, payload = e.status, {'error': str(e)}
+                    except Exception as e:
+                        logger.error(f"Order API error on {method} {path}: {e}")
+                        status, payload = 500, {'error': 'Interner Fehler'}
+
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+                    await self._write_response(writer, status, payload, keep_alive)
+                    if not keep_alive:
+                        break
+            except HTTPError as e:
+                await self._write_response(writer, e.status, {'error': str(e)}, False)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except ConnectionError:
+                    pass
+
+    async def _read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), path, headers, body
+
+    async def _write_response(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        headers = [
+            f"HTTP/1.1 {status} {HTTP_STATUS.get(status, '')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 503:
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode('latin-1') + body)
+        # drain() blocks slow readers here instead of buffering unbounded output
+        await writer.drain()
+
+    async def _dispatch(self, method, path, body):
+        loop = asyncio.get_running_loop()
+        path = path.split('?', 1)[0].rstrip('/')
+
+        if path == '/orders':
+            if method != 'POST':
+                raise HTTPError(405, "Use POST")
+            try:
+                data = json.loads(body or b'null')
+            except ValueError:
+                raise HTTPError(400, "Invalid JSON")
+
+            if isinstance(data, list):
+                results = await self.submit_orders(data)
+                return 200, {'results': results}
+
+            result = (await self.submit_orders([data]))[0]
+            status = {'ok': 200, 'duplicate': 200, 'queued': 202, 'invalid': 400, 'insufficient_stock': 409}.get(result['status'], 500)
+            return status, result
+
+        if path == '/products' and method == 'GET':
+            products = await loop.run_in_executor(self._read_executor, self.service.load_products)
+            return 200, [dict(zip(('product_name', 'color', 'size', 'amount'), p)) for p in products]
+
+        if path.startswith('/customers/') and method == 'GET':
+            kundennummer = path[len('/customers/'):]
+            customer = await loop.run_in_executor(
+                self._read_executor, self.service.load_customer, kundennummer)
+            if not customer:
+                raise HTTPError(404, "Kunde nicht gefunden")
+            return 200, customer
+
+        raise HTTPError(404, "Not found")
+
+
+def run_server(host=API_HOST, port=API_PORT):
+    server = OrderServer(host=host, port=port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("Order API interrupted")
+
+
+if __name__ == "__main__":
+    run_server()
@@ -3,9 +3,12 @@ from tkinter import ttk, messagebox
 import logging
 from database import db
 from utils.logger import setup_logger
+from utils.ui_profiler import install_from_env as install_ui_profiler
 from datetime import datetime
 from utils.inventory_sync import InventorySync
 from utils.print_manager import PrintManager
+from utils.order_service import order_service, InsufficientStockError, OrderValidationError
+from utils.archive import execute_history_query
 
 logger = setup_logger()
 
@@ -27,28 +30,11 @@ class CupOrderApp:
         self.last_name = tk.StringVar()
 
     def setup_database(self):
-        create_tables_query = '''
-            CREATE TABLE IF NOT EXISTS cup_orders (
-                id BIGSERIAL PRIMARY KEY,
-                kundennummer VARCHAR(50) NOT NULL,
-                product_name VARCHAR(100) NOT NULL,
-                quantity INTEGER NOT NULL,
-                color VARCHAR(50),
-                size VARCHAR(50),
-                order_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        '''
         try:
-            conn = db.get_connection()
-            cur = conn.cursor()
-            cur.execute(create_tables_query)
-            conn.commit()
+            order_service.ensure_order_table()
         except Exception as e:
             logger.error(f"Error creating table: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
 
     def setup_ui(self):
         # Customer Information Frame
@@ -119,44 +105,22 @@ class CupOrderApp:
     def load_products(self):
         """Load available products from database"""
         try:
-            query = '''
-                SELECT product_name, color, size, amount 
-                FROM charges 
-                WHERE amount > 0
-                ORDER BY product_name, color, size
-            '''
-            products = db.execute_query(query, fetch=True)
+            products = order_service.load_products()
             
             # Clear existing items
             for item in self.product_tree.get_children():
                 self.product_tree.delete(item)
             
             # Insert new items
-            if products:
-                for product in products:
-                    self.product_tree.insert("", "end", values=product)
-                    
-            logger.info(f"Retrieved {len(products) if products else 0} products from database")
+            for product in products:
+                self.product_tree.insert("", "end", values=product)
         except Exception as e:
             logger.error(f"Error loading products: {e}")
             messagebox.showerror("Fehler", "Fehler beim Laden der Produkte")
 
     def check_stock(self, product_name, quantity, color, size):
         """Check if enough stock is available"""
-        try:
-            query = '''
-                SELECT amount 
-                FROM charges 
-                WHERE product_name = %s 
-                AND color = %s 
-                AND size = %s 
-                AND amount >= %s
-            '''
-            result = db.execute_query(query, (product_name, color, size, quantity), fetch=True)
-            return bool(result)
-        except Exception as e:
-            logger.error(f"Error checking stock: {e}")
-            return False
+        return order_service.check_stock(product_name, quantity, color, size)
 
     def update_inventory(self, product_name, quantity, color, size):
         """Update inventory after order"""
@@ -189,73 +153,25 @@ class CupOrderApp:
             messagebox.showwarning("Warnung", "Keine Produkte in der Bestellung")
             return False
 
+        order_items = [self.order_table.item(item)["values"] for item in items]
         try:
-            conn = db.get_connection()
-            cur = conn.cursor()
-            
-            # Begin transaction
-            cur.execute("BEGIN")
-            
-            for item in items:
-                values = self.order_table.item(item)["values"]
-                product_name, quantity, color, size = values
-                
-                # Save order
-                insert_query = '''
-                    INSERT INTO cup_orders 
-                    (kundennummer, product_name, quantity, color, size)
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING id
-                '''
-                cur.execute(
-                    insert_query, 
-                    (self.customer_id.get(), product_name, quantity, color, size)
-                )
-                
-                # Update inventory
-                update_query = '''
-                    UPDATE charges 
-                    SET amount = amount - %s,
-                        last_updated = CURRENT_TIMESTAMP
-                    WHERE product_name = %s 
-                    AND color = %s 
-                    AND size = %s
-                    AND amount >= %s
-                    RETURNING amount
-                '''
-                cur.execute(
-                    update_query,
-                    (quantity, product_name, color, size, quantity)
-                )
-                
-                update_result = cur.fetchone()
-                if not update_result:
-                    cur.execute("ROLLBACK")
-                    messagebox.showerror("Fehler", f"Nicht genügend Bestand für {product_name}")
-                    return False
-            
-            # Commit transaction
-            conn.commit()
-            
-            # Refresh product list after successful order
-            self.load_products()
-            
-            messagebox.showinfo("Erfolg", "Bestellung erfolgreich gespeichert")
-            return True
-            
+            order_service.save_order(self.customer_id.get(), order_items)
+        except InsufficientStockError as e:
+            messagebox.showerror("Fehler", str(e))
+            return False
+        except OrderValidationError as e:
+            messagebox.showwarning("Warnung", str(e))
+            return False
         except Exception as e:
-            if conn:
-                try:
-                    cur.execute("ROLLBACK")
-                    conn.rollback()
-                except:
-                    pass
-            logger.error(f"Error saving order: {e}")
+            logger.error(f"Error saving order: {e}", extra={'kunden_id': self.customer_id.get()})
             messagebox.showerror("Fehler", f"Fehler beim Speichern der Bestellung: {str(e)}")
             return False
-        finally:
-            if conn:
-                conn.close()
+
+        # Refresh product list after successful order
+        self.load_products()
+
+        messagebox.showinfo("Erfolg", "Bestellung erfolgreich gespeichert")
+        return True
 
     def add_to_order(self):
         """Add selected product to order"""
@@ -363,17 +279,24 @@ class CupOrderApp:
                     order_date,
                     kundennummer,
                     quantity
-                FROM cup_orders 
+                FROM cup_orders_all
                 WHERE product_name = %s 
                 AND color = %s 
                 AND size = %s
                 ORDER BY order_date DESC
             '''
-            history = db.execute_query(query, (product_name, color, size), fetch=True)
+            # Includes archived months (partitions / archive files)
+            history = execute_history_query(query, (product_name, color, size))
             
             if history:
                 for record in history:
-                    formatted_date = record[0].strftime('%Y-%m-%d %H:%M') if record[0] else 'N/A'
+                    if not record[0]:
+                        formatted_date = 'N/A'
+                    elif isinstance(record[0], str):
+                        # SQLite returns timestamps as text
+                        formatted_date = record[0][:16]
+                    else:
+                        formatted_date = record[0].strftime('%Y-%m-%d %H:%M')
                     history_tree.insert("", "end", values=(formatted_date, record[1], record[2]))
             else:
                 history_tree.insert("", "end", values=("Keine Bestellhistorie verfügbar", "", ""))
@@ -409,5 +332,6 @@ class CupOrderApp:
                   command=dialog.destroy).pack(pady=5)
 
 if __name__ == "__main__":
+    install_ui_profiler()
     app = CupOrderApp()
     app.root.mainloop()
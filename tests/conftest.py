@@ -0,0 +1,16 @@
+"""Keep test runs away from the working copy's kunden.db, system.log and journals"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Set before the repo modules are imported: database.db opens kunden.db in the cwd
+_workdir = tempfile.mkdtemp(prefix='tassen-tests-')
+os.chdir(_workdir)
+os.environ['TASSEN_ERROR_SINK'] = '0'
+os.environ['TASSEN_LOG_FILE'] = os.path.join(_workdir, 'system.log')
+os.environ['TASSEN_OFFLINE_JOURNAL'] = os.path.join(_workdir, 'offline_journal.db')
+os.environ['TASSEN_OFFLINE_SNAPSHOT'] = os.path.join(_workdir, 'offline_snapshot.db')
+os.environ.pop('DATABASE_URL', None)
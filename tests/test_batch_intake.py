@@ -0,0 +1,37 @@
+import datetime
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('openpyxl')
+
+from utils.batch_intake import load_frame, validate_frame
+
+
+def test_excel_date_cells_are_accepted(tmp_path):
+    path = str(tmp_path / 'lieferung.xlsx')
+    pd.DataFrame({
+        'Produkt': ['Tasse', 'Becher'],
+        'Farbe': ['Rot', 'Blau'],
+        'Größe': ['M', 'L'],
+        'Hersteller': ['Kahla', 'Kahla'],
+        'Lieferdatum': [datetime.datetime(2026, 10, 1), '02.10.2026'],
+        'Menge': [12, 6],
+    }).to_excel(path, index=False)
+
+    frame = load_frame(path)
+    errors = validate_frame(frame, set(), set())
+
+    assert errors == {}
+    assert frame['delivery_value'].dt.strftime('%Y-%m-%d').tolist() == ['2026-10-01', '2026-10-02']
+
+
+def test_invalid_date_is_rejected(tmp_path):
+    path = str(tmp_path / 'lieferung.xlsx')
+    pd.DataFrame({
+        'Produkt': ['Tasse'], 'Farbe': ['Rot'], 'Größe': ['M'], 'Hersteller': ['Kahla'],
+        'Lieferdatum': ['irgendwann'], 'Menge': [1],
+    }).to_excel(path, index=False)
+
+    frame = load_frame(path)
+    assert validate_frame(frame, set(), set()) == {2: ["Lieferdatum ungültig"]}
@@ -0,0 +1,119 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+from database import DatabaseManager
+
+
+def _value(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT value FROM settings WHERE name = 'mode'").fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def paths(tmp_path):
+    primary = str(tmp_path / 'primary.db')
+    conn = sqlite3.connect(primary)
+    conn.execute("CREATE TABLE settings (name TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("INSERT INTO settings VALUES ('mode', 'old')")
+    conn.commit()
+    conn.close()
+    return primary, str(tmp_path / 'snapshot.db')
+
+
+def _set_primary(path, value):
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE settings SET value = ? WHERE name = 'mode'", (value,))
+    conn.commit()
+    conn.close()
+
+
+READ = "SELECT value FROM settings WHERE name = %s"
+
+
+@pytest.fixture
+def manager():
+    created = []
+
+    def make(primary, snapshot=None, max_staleness=60):
+        # The constructor takes the first snapshot and starts the refresher
+        database = DatabaseManager(sqlite_path=primary, snapshot_path=snapshot, max_staleness=max_staleness)
+        created.append(database)
+        return database
+
+    yield make
+    for database in created:
+        database.stop_snapshot_refresher()
+
+
+def test_fresh_snapshot_serves_reads(paths, manager):
+    primary, snapshot = paths
+    database = manager(primary, snapshot)
+    _set_primary(primary, 'new')
+
+    assert database.execute_query(READ, ('mode',), fetch=True, read_only=True)[0][0] == 'old'
+    assert database.execute_query(READ, ('mode',), fetch=True)[0][0] == 'new'
+
+
+def test_stale_snapshot_falls_back_to_primary(paths, manager):
+    primary, snapshot = paths
+    database = manager(primary, snapshot)
+    _set_primary(primary, 'new')
+    database._snapshot_taken = time.time() - 120
+
+    assert not database.read_target_usable()
+    assert database.execute_query(READ, ('mode',), fetch=True, read_only=True)[0][0] == 'new'
+
+
+def test_unreadable_snapshot_falls_back_to_primary(paths, manager):
+    primary, snapshot = paths
+    database = manager(primary, snapshot)
+    _set_primary(primary, 'new')
+    os.remove(snapshot)
+
+    assert database.read_target_usable()
+    assert database.execute_query(READ, ('mode',), fetch=True, read_only=True)[0][0] == 'new'
+
+
+@pytest.mark.parametrize('lag, expected', [(0.5, 'replica'), (120.0, 'new')])
+def test_replica_is_used_only_while_it_keeps_up(paths, manager, lag, expected):
+    primary, replica = paths
+    conn = sqlite3.connect(replica)
+    conn.execute("CREATE TABLE settings (name TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("INSERT INTO settings VALUES ('mode', 'replica')")
+    conn.commit()
+    conn.close()
+    _set_primary(primary, 'new')
+
+    # Stand-in for a PostgreSQL replica: a second SQLite file with a given replay lag
+    database = manager(primary, max_staleness=30)
+    database.replica_url = 'postgresql://replica'
+    database._replica_lag = lambda: lag
+    database._connect_read = lambda: sqlite3.connect(replica)
+
+    assert database.execute_query(READ, ('mode',), fetch=True, read_only=True)[0][0] == expected
+
+
+def test_writes_never_go_to_the_snapshot(paths, manager):
+    primary, snapshot = paths
+    database = manager(primary, snapshot)
+    assert database.read_target_usable()
+
+    database.execute_query("UPDATE settings SET value = %s WHERE name = %s", ('written', 'mode'))
+    conn = database.get_connection()
+    try:
+        conn.execute("INSERT INTO settings VALUES ('other', 'x')")
+        conn.commit()
+    finally:
+        conn.close()
+
+    assert _value(primary) == 'written'
+    assert _value(snapshot) == 'old'
+    snapshot_conn = sqlite3.connect(snapshot)
+    assert snapshot_conn.execute("SELECT COUNT(*) FROM settings").fetchone()[0] == 1
+    snapshot_conn.close()
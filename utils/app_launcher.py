@@ -0,0 +1,161 @@
+"""Start the Tassen apps either inside the running interpreter or as processes.
+
+In-process mode (default) opens each app as a Toplevel of one Tk root. All
+windows share the imported modules, the database connection pool, the
+order service caches and the logging pipeline, so opening an app does not
+re-import tkinter/psycopg2/PDF libraries or re-run the schema checks.
+
+Subprocess mode keeps the previous behaviour of one Python process per app:
+
+    TASSEN_LAUNCH_MODE=subprocess python -m utils.app_launcher
+"""
+import os
+import sys
+import logging
+import inspect
+import importlib
+import subprocess
+import tkinter as tk
+from tkinter import ttk, messagebox
+
+# Spawned preview workers re-import the main module as __mp_main__, so
+# importing this module must not start the logging pipeline or the profiler;
+# main() does that.
+logger = logging.getLogger('app_launcher')
+
+LAUNCH_MODE = os.getenv('TASSEN_LAUNCH_MODE', 'inprocess')
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (module, app class, window title)
+APPS = {
+    'bestellprogramm': ('bestellprogramm', 'OrderApp', "Bestellverwaltung - Kundendaten"),
+    'tassenbestellung': ('tassenbestellung', 'CupOrderApp', "Tassenbestellung"),
+    'chargen_verwaltung': ('chargen_verwaltung', None, "Chargenverwaltung"),
+}
+
+
+def _resolve_app_class(module, class_name):
+    if class_name:
+        return getattr(module, class_name)
+    # Fall back to the module's own *App class taking a parent_frame
+    for name, obj in vars(module).items():
+        if (inspect.isclass(obj) and obj.__module__ == module.__name__ and name.endswith('App')
+                and 'parent_frame' in inspect.signature(obj.__init__).parameters):
+            return obj
+    raise LookupError(f"No app class found in {module.__name__}")
+
+
+class AppLauncher:
+    """Opens registered apps in-process (Toplevel) or as separate processes"""
+
+    MODES = ('inprocess', 'subprocess')
+
+    def __init__(self, root, mode=LAUNCH_MODE):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown launch mode: {mode}")
+        self.root = root
+        self.mode = mode
+        self._windows = {}
+        self._apps = {}
+        self._processes = {}
+
+        if mode == 'inprocess':
+            # One pool for every window instead of a connection per query
+            from database import db
+            db.enable_pool()
+
+    def open_app(self, name):
+        if name not in APPS:
+            raise KeyError(f"Unknown app: {name}")
+        if self.mode == 'subprocess':
+            return self._start_process(name)
+        return self._open_window(name)
+
+    def _open_window(self, name):
+        window = self._windows.get(name)
+        if window is not None and window.winfo_exists():
+            window.deiconify()
+            window.lift()
+            window.focus_force()
+            return self._apps[name]
+
+        module_name, class_name, title = APPS[name]
+        try:
+            # Imported once per interpreter; later opens reuse the module
+            module = importlib.import_module(module_name)
+            app_class = _resolve_app_class(module, class_name)
+        except Exception as e:
+            logger.error(f"Error loading {name}: {e}")
+            messagebox.showerror("Fehler", f"{name} konnte nicht geladen werden")
+            return None
+
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        try:
+            app = app_class(parent_frame=window)
+        except Exception as e:
+            window.destroy()
+            logger.error(f"Error opening {name}: {e}")
+            messagebox.showerror("Fehler", f"{name} konnte nicht geöffnet werden")
+            return None
+
+        window.protocol("WM_DELETE_WINDOW", lambda: self._close_window(name))
+        self._windows[name] = window
+        self._apps[name] = app
+        logger.info(f"Opened {name} in-process")
+        return app
+
+    def _close_window(self, name):
+        window = self._windows.pop(name, None)
+        self._apps.pop(name, None)
+        if window is not None and window.winfo_exists():
+            window.destroy()
+
+    def _start_process(self, name):
+        process = self._processes.get(name)
+        if process is not None and process.poll() is None:
+            logger.info(f"{name} already running (pid {process.pid})")
+            return process
+
+        module_name = APPS[name][0]
+        try:
+            process = subprocess.Popen([sys.executable, f"{module_name}.py"], cwd=APP_DIR)
+            logger.info(f"Started {module_name} (.py)")
+            logger.info(f"Process started successfully: {module_name}")
+        except Exception as e:
+            logger.error(f"Error starting {module_name}: {e}")
+            messagebox.showerror("Fehler", f"{name} konnte nicht gestartet werden")
+            return None
+        self._processes[name] = process
+        return process
+
+    def close_all(self):
+        for name in list(self._windows):
+            self._close_window(name)
+
+
+def main(mode=LAUNCH_MODE):
+    from utils.logger import setup_logger
+    from utils.ui_profiler import install_from_env as install_ui_profiler
+
+    setup_logger('app_launcher')
+    install_ui_profiler()
+    root = tk.Tk()
+    root.title("Hauptmenü")
+    launcher = AppLauncher(root, mode)
+
+    frame = ttk.Frame(root, padding=10)
+    frame.pack(fill="both", expand=True)
+    for name, (_, _, title) in APPS.items():
+        ttk.Button(frame, text=title, command=lambda n=name: launcher.open_app(n)).pack(fill="x", pady=2)
+
+    def on_close():
+        launcher.close_all()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", on_close)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else LAUNCH_MODE)
@@ -0,0 +1,477 @@
+"""Archival of cup_orders and files history.
+
+PostgreSQL: ``cup_orders`` becomes a table range-partitioned by month on
+``order_date``. Queries with an ``order_date`` predicate only touch the
+matching partitions; the parent table (and the ``cup_orders_all`` view)
+still returns everything.
+
+SQLite: closed months of ``cup_orders`` move into one archive file per
+year (``archiv/cup_orders_YYYY.db``), printed ``files`` rows into
+``archiv/files.db``. ``history_connection()`` attaches the archives and
+exposes ``cup_orders_all`` / ``files_all`` as UNION ALL views (and
+``*_archived`` with the archive rows only), while the hot tables in
+``kunden.db`` only hold current data. SQLite can attach only a few
+databases at once, so readers pass a date range where they have one and
+years beyond the limit are copied into a temp table.
+
+    python -m utils.archive
+"""
+import os
+import re
+import glob
+import time
+import sqlite3
+from datetime import datetime
+from database import db
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+ARCHIVE_DIR = os.getenv('TASSEN_ARCHIVE_DIR', 'archiv')
+KEEP_MONTHS = 1             # current month stays hot; older months are archived
+PARTITION_MONTHS_AHEAD = 3
+
+_views_ready = False
+
+
+def _month_start(value, offset=0):
+    month = value.year * 12 + value.month - 1 + offset
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+# ----------------------------------------------------------------------
+# PostgreSQL
+# ----------------------------------------------------------------------
+def _partition_name(month):
+    return f"cup_orders_{month:%Y_%m}"
+
+
+def is_partitioned_postgres(database=None):
+    database = database or db
+    result = database.execute_query('''
+        SELECT c.relkind FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relname = 'cup_orders'
+    ''', fetch=True)
+    return bool(result) and result[0][0] == 'p'
+
+
+def ensure_partitions_postgres(months_ahead=PARTITION_MONTHS_AHEAD, since=None, database=None):
+    """Create monthly partitions from `since` (default: this month) up to months_ahead.
+
+    Rows that already landed in cup_orders_default for a month without a
+    partition are moved into the new partition; PostgreSQL refuses to
+    create a partition whose range matches rows of the default partition.
+    """
+    database = database or db
+    if not is_partitioned_postgres(database):
+        return
+    conn = database.get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                    "WHERE i.inhparent = 'cup_orders'::regclass")
+        existing = {row[0] for row in cur.fetchall()}
+        has_default = 'cup_orders_default' in existing
+        start = since or datetime.now()
+        if has_default:
+            cur.execute("SELECT MIN(order_date) FROM cup_orders_default")
+            oldest = cur.fetchone()[0]
+            if oldest is not None and oldest < start:
+                start = oldest
+        column_list = ', '.join(name for name, _ in _columns_postgres(cur, 'cup_orders'))
+
+        month = _month_start(start)
+        last = _month_start(datetime.now(), months_ahead)
+        while month <= last:
+            upper = _month_start(month, 1)
+            name = _partition_name(month)
+            create = f'''
+                CREATE TABLE {name} PARTITION OF cup_orders
+                FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')
+            '''
+            if name in existing:
+                month = upper
+                continue
+            if has_default and _default_has_rows(cur, month, upper):
+                # Detached, the default partition no longer blocks the new range
+                cur.execute("ALTER TABLE cup_orders DETACH PARTITION cup_orders_default")
+                cur.execute(create)
+                cur.execute(f'''
+                    WITH moved AS (
+                        DELETE FROM cup_orders_default
+                        WHERE order_date >= %s AND order_date < %s
+                        RETURNING {column_list}
+                    )
+                    INSERT INTO {name} ({column_list}) SELECT {column_list} FROM moved
+                ''', (month, upper))
+                logger.info(f"Moved {cur.rowcount} rows from cup_orders_default into {name}")
+                cur.execute("ALTER TABLE cup_orders ATTACH PARTITION cup_orders_default DEFAULT")
+            else:
+                cur.execute(create)
+            month = upper
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error creating cup_orders partitions: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _default_has_rows(cur, month, upper):
+    cur.execute("SELECT 1 FROM cup_orders_default WHERE order_date >= %s AND order_date < %s LIMIT 1",
+                (month, upper))
+    return cur.fetchone() is not None
+
+
+def _columns_postgres(cur, table):
+    """[(column, type)] of a table in column order"""
+    cur.execute('''
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+        FROM pg_attribute a
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum
+    ''', (table,))
+    return cur.fetchall()
+
+
+def partition_cup_orders_postgres(months_ahead=PARTITION_MONTHS_AHEAD, database=None):
+    """One-time migration of cup_orders into a monthly range-partitioned table.
+
+    The old table is kept as cup_orders_legacy until someone drops it.
+    """
+    database = database or db
+    if is_partitioned_postgres(database):
+        ensure_partitions_postgres(months_ahead, database=database)
+        return False
+
+    conn = database.get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT pg_get_serial_sequence('cup_orders', 'id')")
+        sequence = cur.fetchone()[0]
+        cur.execute("SELECT MIN(order_date) FROM cup_orders")
+        oldest = cur.fetchone()[0] or datetime.now()
+
+        # The view would follow the rename and keep pointing at the legacy table
+        cur.execute("DROP VIEW IF EXISTS cup_orders_all")
+        cur.execute("ALTER TABLE cup_orders RENAME TO cup_orders_legacy")
+        cur.execute('''
+            CREATE TABLE cup_orders (LIKE cup_orders_legacy INCLUDING DEFAULTS)
+            PARTITION BY RANGE (order_date)
+        ''')
+        cur.execute("ALTER TABLE cup_orders ALTER COLUMN order_date SET DEFAULT CURRENT_TIMESTAMP")
+        # The partition key must be part of the primary key; this also makes order_date NOT NULL.
+        # cup_orders_pkey is still taken by the legacy table.
+        cur.execute("ALTER TABLE cup_orders ADD CONSTRAINT cup_orders_part_pkey PRIMARY KEY (id, order_date)")
+        if sequence:
+            # The copied id default keeps using the sequence; it must outlive the legacy table
+            cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY cup_orders.id")
+        else:
+            cur.execute("CREATE SEQUENCE IF NOT EXISTS cup_orders_id_seq OWNED BY cup_orders.id")
+            cur.execute("SELECT setval('cup_orders_id_seq', COALESCE((SELECT MAX(id) FROM cup_orders_legacy), 0) + 1, false)")
+            cur.execute("ALTER TABLE cup_orders ALTER COLUMN id SET DEFAULT nextval('cup_orders_id_seq')")
+
+        cur.execute("CREATE TABLE cup_orders_default PARTITION OF cup_orders DEFAULT")
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS idx_cup_orders_product
+            ON cup_orders (product_name, color, size, order_date)
+        ''')
+
+        month = _month_start(oldest)
+        last = _month_start(datetime.now(), months_ahead)
+        while month <= last:
+            upper = _month_start(month, 1)
+            cur.execute(f'''
+                CREATE TABLE {_partition_name(month)} PARTITION OF cup_orders
+                FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')
+            ''')
+            month = upper
+
+        columns = [name for name, _ in _columns_postgres(cur, 'cup_orders_legacy')]
+        select = ', '.join('COALESCE(order_date, NOW())' if c == 'order_date' else c for c in columns)
+        cur.execute(f"INSERT INTO cup_orders ({', '.join(columns)}) SELECT {select} FROM cup_orders_legacy")
+        moved = cur.rowcount
+        cur.execute("CREATE VIEW cup_orders_all AS SELECT * FROM cup_orders")
+        conn.commit()
+        logger.info(f"cup_orders partitioned by month: {moved} rows moved, legacy table kept as cup_orders_legacy")
+        return True
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error partitioning cup_orders: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def archive_files_postgres(database=None):
+    """Move printed files rows into files_archive"""
+    database = database or db
+    conn = database.get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("CREATE TABLE IF NOT EXISTS files_archive (LIKE files INCLUDING DEFAULTS)")
+        columns = _columns_postgres(cur, 'files')
+        archived = {name for name, _ in _columns_postgres(cur, 'files_archive')}
+        for name, column_type in columns:
+            if name not in archived:
+                # files gained a column after files_archive was created
+                cur.execute(f"ALTER TABLE files_archive ADD COLUMN {name} {column_type}")
+        column_list = ', '.join(name for name, _ in columns)
+        cur.execute(f'''
+            WITH moved AS (
+                DELETE FROM files WHERE gedruckt = TRUE RETURNING {column_list}
+            )
+            INSERT INTO files_archive ({column_list}) SELECT {column_list} FROM moved
+        ''')
+        moved = cur.rowcount
+        cur.execute(f'''
+            CREATE OR REPLACE VIEW files_all AS
+            SELECT {column_list} FROM files UNION ALL SELECT {column_list} FROM files_archive
+        ''')
+        conn.commit()
+        logger.info(f"Archived {moved} printed files rows")
+        return moved
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error archiving files: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+# ----------------------------------------------------------------------
+# SQLite
+# ----------------------------------------------------------------------
+def _archive_files(date_from=None, date_to=None):
+    """Yearly cup_orders archives overlapping [date_from, date_to) as {alias: path}, oldest first"""
+    archives = {}
+    for path in sorted(glob.glob(os.path.join(ARCHIVE_DIR, 'cup_orders_*.db'))):
+        match = re.search(r'cup_orders_(\d{4})\.db$', path)
+        if not match:
+            continue
+        year = match.group(1)
+        if (date_from and year < str(date_from)[:4]) or (date_to and year > str(date_to)[:4]):
+            continue
+        archives[f"arch_{year}"] = path
+    return archives
+
+
+def _files_archive():
+    path = os.path.join(ARCHIVE_DIR, 'files.db')
+    return path if os.path.exists(path) else None
+
+
+def _attach_limit(conn):
+    try:
+        return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    except AttributeError:
+        # Python < 3.11: SQLite's compiled-in default
+        return 10
+
+
+def _history_source(database, archives):
+    """Snapshot if it is fresh and no archival ran since it was taken, else the primary"""
+    if not database.read_target_usable():
+        return database.SQLITE_DB_PATH
+    lag = database.read_lag()
+    if lag is None:
+        return database.SQLITE_DB_PATH
+    # An archival after the snapshot moved rows the snapshot still holds in main;
+    # one second of slack for the file system's mtime resolution
+    taken = time.time() - lag - 1
+    if any(os.path.getmtime(path) >= taken for path in archives):
+        return database.SQLITE_DB_PATH
+    return database.snapshot_path
+
+
+def _table_columns(cur, schema, table):
+    cur.execute(f"PRAGMA {schema}.table_info({table})")
+    return [row[1] for row in cur.fetchall()]
+
+
+def _move_rows(cur, alias, table, where, params):
+    """Copy matching rows into alias.table (created on demand) and delete them from main"""
+    columns = _table_columns(cur, 'main', table)
+    archived = _table_columns(cur, alias, table)
+    if not archived:
+        cur.execute(f"CREATE TABLE {alias}.{table} AS SELECT * FROM main.{table} WHERE 0")
+    else:
+        for column in columns:
+            if column not in archived:
+                cur.execute(f"ALTER TABLE {alias}.{table} ADD COLUMN {column}")
+    column_list = ', '.join(columns)
+    cur.execute(f"INSERT INTO {alias}.{table} ({column_list}) SELECT {column_list} FROM main.{table} WHERE {where}", params)
+    cur.execute(f"DELETE FROM main.{table} WHERE {where}", params)
+    return cur.rowcount
+
+
+def archive_closed_months_sqlite(keep_months=KEEP_MONTHS, database=None):
+    """Move cup_orders of closed months and printed files into archive files"""
+    database = database or db
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    cutoff = _month_start(datetime.now(), 1 - keep_months).strftime('%Y-%m-%d')
+
+    conn = sqlite3.connect(database.SQLITE_DB_PATH, timeout=30)
+    cur = conn.cursor()
+    moved = {'cup_orders': 0, 'files': 0}
+    try:
+        cur.execute("SELECT DISTINCT substr(order_date, 1, 4) FROM cup_orders WHERE order_date < ?", (cutoff,))
+        years = [row[0] for row in cur.fetchall() if row[0]]
+
+        # ATTACH is not allowed inside a transaction. Beyond SQLite's attach
+        # limit the years are moved in several transactions.
+        cur.execute("ATTACH DATABASE ? AS arch_files", (os.path.join(ARCHIVE_DIR, 'files.db'),))
+        chunk_size = max(1, _attach_limit(conn) - 1)
+        for start in range(0, len(years), chunk_size):
+            chunk = years[start:start + chunk_size]
+            for year in chunk:
+                cur.execute(f"ATTACH DATABASE ? AS arch_{year}",
+                            (os.path.join(ARCHIVE_DIR, f"cup_orders_{year}.db"),))
+            cur.execute("BEGIN")
+            for year in chunk:
+                moved['cup_orders'] += _move_rows(
+                    cur, f"arch_{year}", 'cup_orders',
+                    "order_date >= ? AND order_date < ? AND order_date < ?",
+                    (f"{year}-01-01", f"{int(year) + 1}-01-01", cutoff))
+            conn.commit()
+            for year in chunk:
+                cur.execute(f"DETACH DATABASE arch_{year}")
+
+        cur.execute("BEGIN")
+        moved['files'] = _move_rows(cur, 'arch_files', 'files', "gedruckt = 1", ())
+        conn.commit()
+        logger.info(f"Archived closed months before {cutoff}: {moved}")
+        return moved
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error archiving history: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _select_columns(columns, available):
+    # Older archives may lack newer columns
+    return ', '.join(c if c in available else f"NULL AS {c}" for c in columns)
+
+
+def history_connection(database=None, date_from=None, date_to=None):
+    """SQLite connection with the archives attached and cup_orders_all/files_all views.
+
+    Only yearly archives overlapping [date_from, date_to) are included.
+    """
+    database = database or db
+    archives = _archive_files(date_from, date_to)
+    files_archive = _files_archive()
+    paths = list(archives.values()) + ([files_archive] if files_archive else [])
+    conn = sqlite3.connect(_history_source(database, paths), timeout=30)
+    cur = conn.cursor()
+    try:
+        columns = {table: _table_columns(cur, 'main', table) for table in ('cup_orders', 'files')}
+        attached = {'cup_orders': [], 'files': []}
+
+        # The newest years stay attached next to files.db; older ones are copied
+        # into a temp table first, one attachment at a time
+        slots = max(1, _attach_limit(conn) - 1)
+        years = list(archives.items())
+        spill, keep = years[:-slots], years[-slots:]
+        if spill:
+            column_list = ', '.join(columns['cup_orders'])
+            cur.execute(f"CREATE TEMP TABLE cup_orders_spill AS SELECT {column_list} FROM main.cup_orders WHERE 0")
+            for alias, path in spill:
+                cur.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+                archived = _table_columns(cur, alias, 'cup_orders')
+                if archived:
+                    cur.execute(f"INSERT INTO temp.cup_orders_spill SELECT "
+                                f"{_select_columns(columns['cup_orders'], archived)} FROM {alias}.cup_orders")
+                # DETACH is refused while a transaction is open
+                conn.commit()
+                cur.execute(f"DETACH DATABASE {alias}")
+            attached['cup_orders'].append(f"SELECT {column_list} FROM temp.cup_orders_spill")
+
+        for alias, path in keep:
+            cur.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+            archived = _table_columns(cur, alias, 'cup_orders')
+            if archived:
+                attached['cup_orders'].append(
+                    f"SELECT {_select_columns(columns['cup_orders'], archived)} FROM {alias}.cup_orders")
+        if files_archive:
+            cur.execute("ATTACH DATABASE ? AS arch_files", (files_archive,))
+            archived = _table_columns(cur, 'arch_files', 'files')
+            if archived:
+                attached['files'].append(f"SELECT {_select_columns(columns['files'], archived)} FROM arch_files.files")
+
+        for table, archived_parts in attached.items():
+            column_list = ', '.join(columns[table])
+            hot = f"SELECT {column_list} FROM main.{table}"
+            cur.execute(f"CREATE TEMP VIEW {table}_all AS {' UNION ALL '.join([hot] + archived_parts)}")
+            # Only the archived rows, for readers that scan the hot table themselves
+            archived_parts = archived_parts or [f"{hot} WHERE 0"]
+            cur.execute(f"CREATE TEMP VIEW {table}_archived AS {' UNION ALL '.join(archived_parts)}")
+        cur.close()
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+def _ensure_views_once(database):
+    global _views_ready
+    if not _views_ready:
+        ensure_history_views_postgres(database)
+        _views_ready = True
+
+
+def open_history_connection(database=None, date_from=None, date_to=None):
+    """Read connection on which cup_orders_all / files_all resolve; caller closes it.
+
+    On SQLite [date_from, date_to) limits which archive files are included.
+    """
+    database = database or db
+    if database.use_sqlite:
+        return history_connection(database, date_from, date_to)
+    _ensure_views_once(database)
+    return database.get_connection(read_only=True)
+
+
+def execute_history_query(query, params=None, database=None, date_from=None, date_to=None):
+    """Run a read query that may use cup_orders_all / files_all"""
+    database = database or db
+    if not database.use_sqlite:
+        _ensure_views_once(database)
+        return database.execute_query(query, params, fetch=True, read_only=True)
+
+    conn = history_connection(database, date_from, date_to)
+    try:
+        return database.execute_query(query, params, fetch=True, conn=conn)
+    finally:
+        conn.close()
+
+
+def ensure_history_views_postgres(database=None):
+    """Keep the *_all views available on PostgreSQL even before archiving"""
+    database = database or db
+    database.execute_query("CREATE OR REPLACE VIEW cup_orders_all AS SELECT * FROM cup_orders")
+    tables = database.execute_query(
+        "SELECT 1 FROM pg_tables WHERE schemaname = 'public' AND tablename = 'files_archive'", fetch=True)
+    if not tables:
+        database.execute_query("CREATE OR REPLACE VIEW files_all AS SELECT * FROM files")
+
+
+def run_archival(database=None):
+    database = database or db
+    if database.use_sqlite:
+        return archive_closed_months_sqlite(database=database)
+    ensure_history_views_postgres(database)
+    partition_cup_orders_postgres(database=database)
+    return {'files': archive_files_postgres(database)}
+
+
+if __name__ == "__main__":
+    print(run_archival())
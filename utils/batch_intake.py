@@ -0,0 +1,274 @@
+"""Intake of a whole supplier delivery (CSV/Excel) into ``charges``.
+
+The file is loaded into a pandas frame and validated column-wise:
+required fields, amount and date types, duplicates inside the file and
+against the ``batch_number``/``internal_id`` values already in the
+database. Missing ``INT-``/``BATCH-`` ids are allocated as one block from
+the ``batch_number`` sequence, and all valid rows are inserted in a single
+transaction. Every rejected row is listed with its spreadsheet row number.
+
+    python -m utils.batch_intake lieferung.xlsx --errors fehler.csv
+"""
+import csv
+import argparse
+from datetime import datetime
+from database import db
+from utils.logger import setup_logger
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+logger = setup_logger()
+
+COLUMNS = ('internal_id', 'product_name', 'supplier_name', 'color', 'size', 'manufacturer',
+           'external_id', 'batch_number', 'delivery_date', 'amount')
+REQUIRED = ('product_name', 'color', 'size', 'manufacturer', 'delivery_date', 'amount')
+SEQUENCE_NAME = 'batch_number'
+# Excel date cells arrive as '2026-10-01 00:00:00' strings
+DATE_FORMATS = ('%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%d.%m.%Y', '%d.%m.%y')
+INSERT_RETRIES = 2
+
+# Header names used in supplier sheets
+COLUMN_ALIASES = {
+    'produkt': 'product_name',
+    'artikel': 'product_name',
+    'lieferant': 'supplier_name',
+    'farbe': 'color',
+    'größe': 'size',
+    'groesse': 'size',
+    'hersteller': 'manufacturer',
+    'externe_id': 'external_id',
+    'artikelnummer': 'external_id',
+    'charge': 'batch_number',
+    'chargennummer': 'batch_number',
+    'lieferdatum': 'delivery_date',
+    'menge': 'amount',
+    'anzahl': 'amount',
+}
+
+
+def _require_pandas():
+    if pd is None:
+        raise RuntimeError("Batch intake requires pandas (pip install pandas)")
+
+
+def load_frame(path):
+    """Read a delivery file into a frame of stripped strings (NA for empty cells)"""
+    _require_pandas()
+    if path.lower().endswith(('.xlsx', '.xls')):
+        frame = pd.read_excel(path, dtype=str)
+    else:
+        # Sniff ';' (German Excel) or ','
+        frame = pd.read_csv(path, dtype=str, sep=None, engine='python', encoding='utf-8-sig')
+    return normalize_frame(frame)
+
+
+def normalize_frame(frame):
+    _require_pandas()
+    frame = frame.rename(columns=lambda c: str(c).strip().lower().replace(' ', '_'))
+    frame = frame.rename(columns=COLUMN_ALIASES)
+    for column in COLUMNS:
+        if column not in frame.columns:
+            frame[column] = pd.NA
+    frame = frame[list(COLUMNS)].astype('object')
+    for column in COLUMNS:
+        values = frame[column].where(frame[column].notna(), None)
+        values = values.map(lambda v: None if v is None else str(v).strip() or None)
+        frame[column] = values
+    # Row numbers as the operator sees them in the spreadsheet (header = 1)
+    frame.index = pd.RangeIndex(2, len(frame) + 2, name='row')
+    return frame
+
+
+def _parse_dates(values):
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    for fmt in DATE_FORMATS:
+        missing = parsed.isna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(values[missing], format=fmt, errors='coerce')
+    return parsed
+
+
+def load_existing_ids(database=None):
+    """Sets of batch_number and internal_id values already in charges"""
+    database = database or db
+    rows = database.execute_query("SELECT batch_number, internal_id FROM charges", fetch=True)
+    batches = {r[0] for r in rows if r[0] is not None}
+    internal_ids = {r[1] for r in rows if r[1] is not None}
+    return batches, internal_ids
+
+
+def validate_frame(frame, existing_batches, existing_ids):
+    """Add parsed columns and return {row: [error, ...]} for rejected rows"""
+    errors = {}
+
+    def flag(mask, message):
+        for row in frame.index[mask.to_numpy()]:
+            errors.setdefault(int(row), []).append(message)
+
+    for column in REQUIRED:
+        flag(frame[column].isna(), f"Pflichtfeld fehlt: {column}")
+
+    amount = pd.to_numeric(frame['amount'].str.replace(',', '.', regex=False), errors='coerce')
+    given = frame['amount'].notna()
+    flag(given & amount.isna(), "Menge ist keine Zahl")
+    flag(amount.notna() & ((amount < 0) | (amount % 1 != 0)), "Menge muss eine ganze Zahl >= 0 sein")
+    frame['amount_value'] = amount
+
+    dates = _parse_dates(frame['delivery_date'])
+    flag(frame['delivery_date'].notna() & dates.isna(), "Lieferdatum ungültig")
+    frame['delivery_value'] = dates
+
+    for column, existing, label in (('batch_number', existing_batches, 'Chargennummer'),
+                                    ('internal_id', existing_ids, 'Interne ID')):
+        values = frame[column]
+        present = values.notna()
+        flag(present & values.duplicated(keep=False), f"{label} mehrfach in der Datei")
+        flag(present & values.isin(existing), f"{label} existiert bereits")
+
+    return errors
+
+
+def _id_floor(frame, existing_batches, existing_ids):
+    """Highest number already used in INT-/BATCH- ids, so the sequence skips it"""
+    ids = pd.Series(list(existing_ids) + frame['internal_id'].dropna().tolist(), dtype='object')
+    batches = pd.Series(list(existing_batches) + frame['batch_number'].dropna().tolist(), dtype='object')
+    numbers = pd.concat([
+        ids.astype(str).str.extract(r'^INT-(\d+)$')[0],
+        batches.astype(str).str.extract(r'^BATCH-\d{8}-(\d+)$')[0],
+    ])
+    numbers = pd.to_numeric(numbers, errors='coerce').dropna()
+    return int(numbers.max()) if len(numbers) else 0
+
+
+def _assign_ids(frame, numbers):
+    """Fill missing internal_id / batch_number of the given rows from sequence numbers"""
+    numbers = pd.Series(numbers, index=frame.index, dtype='int64').astype(str)
+    internal = 'INT-' + numbers.str.zfill(8)
+    batch = 'BATCH-' + frame['delivery_value'].dt.strftime('%Y%m%d') + '-' + numbers.str.zfill(6)
+    frame['internal_id'] = frame['internal_id'].where(frame['internal_id'].notna(), internal)
+    frame['batch_number'] = frame['batch_number'].where(frame['batch_number'].notna(), batch)
+    return frame
+
+
+def _insert(frame, existing_batches, existing_ids, database):
+    """Allocate ids and insert all rows in one transaction; returns the sequence range"""
+    needs_ids = frame['internal_id'].isna() | frame['batch_number'].isna()
+    conn = database.get_connection()
+    cur = conn.cursor()
+    try:
+        floor = _id_floor(frame, existing_batches, existing_ids)
+        numbers = database.reserve_sequence_block(cur, SEQUENCE_NAME, int(needs_ids.sum()), floor)
+        if numbers:
+            frame.loc[needs_ids] = _assign_ids(frame.loc[needs_ids].copy(), numbers)
+
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        rows = list(zip(
+            frame['internal_id'], frame['product_name'], frame['supplier_name'], frame['color'],
+            frame['size'], frame['manufacturer'], frame['external_id'], frame['batch_number'],
+            frame['delivery_value'].dt.strftime('%Y-%m-%d'), frame['amount_value'].astype('int64').tolist(),
+            [now] * len(frame),
+        ))
+        query = '''
+            INSERT INTO charges (internal_id, product_name, supplier_name, color, size, manufacturer,
+                                 external_id, batch_number, delivery_date, amount, last_updated)
+            VALUES %s
+        '''
+        if database.use_sqlite:
+            cur.executemany(database.adapt_query(query.replace('%s', '(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)')), rows)
+        else:
+            from psycopg2.extras import execute_values
+            execute_values(cur, query, rows, page_size=1000)
+        conn.commit()
+        return (numbers[0], numbers[-1]) if numbers else None
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _cell(frame, row, column):
+    value = frame.at[row, column]
+    return None if pd.isna(value) else value
+
+
+def intake_frame(frame, strict=False, database=None):
+    """Validate and insert a normalized frame; returns a report dict.
+
+    With strict=True nothing is inserted when any row is invalid.
+    """
+    database = database or db
+    started = datetime.now()
+    for attempt in range(INSERT_RETRIES):
+        work = frame.copy()
+        existing_batches, existing_ids = load_existing_ids(database)
+        errors = validate_frame(work, existing_batches, existing_ids)
+        valid = work.loc[~work.index.isin(list(errors))].copy()
+
+        allocated = None
+        if len(valid) and not (strict and errors):
+            try:
+                allocated = _insert(valid, existing_batches, existing_ids, database)
+            except Exception as e:
+                # Another intake may have inserted the same batch meanwhile: revalidate once
+                if attempt + 1 < INSERT_RETRIES:
+                    logger.warning(f"Batch intake insert failed, revalidating: {e}")
+                    continue
+                logger.error(f"Batch intake failed: {e}")
+                raise
+        break
+
+    inserted = 0 if strict and errors else len(valid)
+    report = {
+        'rows': len(frame),
+        'inserted': inserted,
+        'rejected': len(errors),
+        'allocated': allocated,
+        'seconds': round((datetime.now() - started).total_seconds(), 3),
+        'errors': [
+            {'row': row, 'batch_number': _cell(frame, row, 'batch_number'),
+             'product_name': _cell(frame, row, 'product_name'), 'errors': messages}
+            for row, messages in sorted(errors.items())
+        ],
+        'batch_numbers': valid['batch_number'].tolist() if inserted else [],
+    }
+    logger.info(f"Batch intake: {report['inserted']} of {report['rows']} rows inserted, "
+                f"{report['rejected']} rejected")
+    return report
+
+
+def intake_file(path, strict=False, database=None):
+    return intake_frame(load_frame(path), strict=strict, database=database)
+
+
+def write_error_report(report, path):
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(('Zeile', 'Chargennummer', 'Produkt', 'Fehler'))
+        for error in report['errors']:
+            writer.writerow((error['row'], error['batch_number'] or '', error['product_name'] or '',
+                             '; '.join(error['errors'])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a supplier delivery into charges")
+    parser.add_argument('path', help="delivery file (.csv or .xlsx)")
+    parser.add_argument('--errors', help="write rejected rows to this CSV file")
+    parser.add_argument('--strict', action='store_true', help="import nothing if any row is invalid")
+    args = parser.parse_args()
+
+    report = intake_file(args.path, strict=args.strict)
+    if args.errors and report['errors']:
+        write_error_report(report, args.errors)
+    print(f"{report['inserted']} von {report['rows']} Zeilen importiert, {report['rejected']} abgelehnt")
+    for error in report['errors'][:20]:
+        print(f"  Zeile {error['row']}: {', '.join(error['errors'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Structured error capture into the ``error_log`` table.
+
+The sink is a logging handler on the background log listener, so every
+module's ``logger.error(...)`` ends up here without extra calls. Errors are
+aggregated in memory per fingerprint, customer and time window and written
+with one batched insert per flush. Pass a customer with
+``logger.error(msg, extra={'kunden_id': ...})`` to make it queryable per
+customer.
+"""
+import re
+import time
+import atexit
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from utils.logger import add_log_handler, remove_log_handler
+
+FLUSH_INTERVAL = 5          # seconds between flushes of closed windows
+AGGREGATION_WINDOW = 60     # seconds per count bucket
+MAX_BUFFERED_GROUPS = 10000
+
+_VARIABLE_PARTS = re.compile(r"'[^']*'|\"[^\"]*\"|0x[0-9a-fA-F]+|\d+")
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def error_fingerprint(module, message):
+    """Stable id for an error independent of numbers and quoted values"""
+    first_line = message.splitlines()[0] if message else ''
+    normalized = _VARIABLE_PARTS.sub('?', first_line)
+    return hashlib.sha1(f"{module}|{normalized}".encode('utf-8')).hexdigest()[:16]
+
+
+def _timestamp(epoch):
+    return datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class ErrorLogSink(logging.Handler):
+    """Buffers ERROR records and flushes aggregated rows to error_log"""
+
+    # Sees repeats the file log suppresses, so counts stay exact
+    receives_duplicates = True
+
+    def __init__(self, database, flush_interval=FLUSH_INTERVAL, window=AGGREGATION_WINDOW):
+        super().__init__(level=logging.ERROR)
+        self.db = database
+        self.flush_interval = flush_interval
+        self.window = window
+        self._buffer = {}
+        self._buffer_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.ensure_schema()
+        self._thread = threading.Thread(target=self._run, name='error-log-sink', daemon=True)
+        self._thread.start()
+
+    def ensure_schema(self):
+        id_column = 'INTEGER PRIMARY KEY AUTOINCREMENT' if self.db.use_sqlite else 'BIGSERIAL PRIMARY KEY'
+        self.db.execute_query(f'''
+            CREATE TABLE IF NOT EXISTS error_log (
+                id {id_column},
+                timestamp TEXT,
+                fehlernachricht TEXT,
+                kunden_id TEXT
+            )
+        ''')
+        self.db.add_missing_columns('error_log', {
+            'fingerprint': 'TEXT',
+            'modul': 'TEXT',
+            'anzahl': 'INTEGER DEFAULT 1',
+            'letzter_zeitpunkt': 'TEXT',
+        })
+        self.db.execute_query(
+            "CREATE INDEX IF NOT EXISTS idx_error_log_kunde ON error_log (kunden_id, timestamp)")
+        self.db.execute_query(
+            "CREATE INDEX IF NOT EXISTS idx_error_log_fingerprint ON error_log (fingerprint, timestamp)")
+
+    def emit(self, record):
+        # Errors raised while flushing must not feed back into the sink
+        if record.thread == self._thread.ident:
+            return
+        try:
+            message = record.getMessage()
+            kunden_id = getattr(record, 'kunden_id', None)
+            fingerprint = error_fingerprint(record.name, message)
+            window_start = int(record.created // self.window * self.window)
+            key = (fingerprint, None if kunden_id is None else str(kunden_id), window_start)
+
+            with self._buffer_lock:
+                group = self._buffer.get(key)
+                if group is None:
+                    if len(self._buffer) >= MAX_BUFFERED_GROUPS:
+                        return
+                    self._buffer[key] = {
+                        'first': record.created,
+                        'last': record.created,
+                        'count': 1,
+                        'message': message,
+                        'module': record.name,
+                    }
+                else:
+                    group['count'] += 1
+                    group['last'] = record.created
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush_buffer()
+
+    def flush_buffer(self, force=False):
+        """Write all closed windows (every window with force) to error_log"""
+        if getattr(self.db, 'offline', False):
+            return 0
+
+        now = time.time()
+        with self._buffer_lock:
+            ready = {k: v for k, v in self._buffer.items() if force or k[2] + self.window <= now}
+            for key in ready:
+                del self._buffer[key]
+        if not ready:
+            return 0
+
+        rows = [
+            (_timestamp(group['first']), group['message'], kunden_id, fingerprint,
+             group['module'], group['count'], _timestamp(group['last']))
+            for (fingerprint, kunden_id, _), group in ready.items()
+        ]
+        try:
+            self.db.execute_many('''
+                INSERT INTO error_log
+                (timestamp, fehlernachricht, kunden_id, fingerprint, modul, anzahl, letzter_zeitpunkt)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ''', rows)
+        except Exception:
+            # Keep the events for the next attempt, merging with newer counts
+            with self._buffer_lock:
+                for key, group in ready.items():
+                    current = self._buffer.get(key)
+                    if current is None:
+                        self._buffer[key] = group
+                    else:
+                        current['count'] += group['count']
+                        current['first'] = min(current['first'], group['first'])
+            return 0
+        return len(rows)
+
+    def close(self):
+        self._stop_event.set()
+        self.flush_buffer(force=True)
+        super().close()
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def _query(self, where, params, limit):
+        rows = self.db.execute_query(f'''
+            SELECT timestamp, letzter_zeitpunkt, modul, fingerprint, kunden_id, anzahl, fehlernachricht
+            FROM error_log
+            WHERE {where}
+            ORDER BY timestamp DESC
+            LIMIT %s
+        ''', params + (limit,), fetch=True, read_only=True)
+        keys = ('timestamp', 'letzter_zeitpunkt', 'modul', 'fingerprint', 'kunden_id', 'anzahl', 'fehlernachricht')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def errors_for_customer(self, kunden_id, limit=100):
+        return self._query("kunden_id = %s", (str(kunden_id),), limit)
+
+    def errors_by_fingerprint(self, fingerprint, limit=100):
+        return self._query("fingerprint = %s", (fingerprint,), limit)
+
+    def top_errors(self, since=None, limit=20):
+        """Most frequent error fingerprints, optionally since a 'YYYY-MM-DD HH:MM:SS' timestamp"""
+        where, params = '', ()
+        if since:
+            where, params = 'WHERE timestamp >= %s', (since,)
+        rows = self.db.execute_query(f'''
+            SELECT fingerprint, MIN(modul), MIN(fehlernachricht), SUM(anzahl), MAX(letzter_zeitpunkt)
+            FROM error_log
+            {where}
+            GROUP BY fingerprint
+            ORDER BY SUM(anzahl) DESC
+            LIMIT %s
+        ''', params + (limit,), fetch=True, read_only=True)
+        keys = ('fingerprint', 'modul', 'fehlernachricht', 'anzahl', 'letzter_zeitpunkt')
+        return [dict(zip(keys, row)) for row in rows]
+
+
+def install_error_sink(database):
+    """Attach one ErrorLogSink to the logging pipeline; later calls return it"""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = ErrorLogSink(database)
+            add_log_handler(_sink)
+            atexit.register(uninstall_error_sink)
+    return _sink
+
+
+def uninstall_error_sink():
+    global _sink
+    with _sink_lock:
+        if _sink is not None:
+            remove_log_handler(_sink)
+            _sink.close()
+            _sink = None
@@ -0,0 +1,208 @@
+"""Streaming CSV / gzip-CSV / XLSX export of orders and inventory.
+
+Rows are pulled in chunks (a named server-side cursor on PostgreSQL,
+``fetchmany`` on SQLite) and written straight to the output file, so
+memory use does not depend on the size of the extract.
+
+    python -m utils.export orders bestellungen_2024.csv.gz --from 2024-01-01 --to 2025-01-01
+    python -m utils.export inventory bestand.xlsx
+"""
+import csv
+import time
+import gzip
+import uuid
+import argparse
+from datetime import date, datetime
+from database import db
+from utils.archive import open_history_connection
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+FETCH_SIZE = 5000
+CSV_DELIMITER = ';'     # what German Excel expects
+
+DATASETS = {
+    'orders': {
+        'columns': ('id', 'order_date', 'kundennummer', 'vorname', 'nachname', 'bestellnummer',
+                    'product_name', 'color', 'size', 'quantity', 'supplier_name', 'manufacturer'),
+        'query': '''
+            SELECT o.id, o.order_date, o.kundennummer, c.vorname, c.nachname, c.bestellnummer,
+                   o.product_name, o.color, o.size, o.quantity, ch.supplier_name, ch.manufacturer
+            FROM cup_orders_all o
+            LEFT JOIN customers c ON c.kundennummer = o.kundennummer
+            LEFT JOIN (
+                SELECT product_name, color, size,
+                       MIN(supplier_name) AS supplier_name, MIN(manufacturer) AS manufacturer
+                FROM charges
+                GROUP BY product_name, color, size
+            ) ch ON ch.product_name = o.product_name AND ch.color = o.color AND ch.size = o.size
+            {where}
+            ORDER BY o.order_date, o.id
+        ''',
+        'date_column': 'o.order_date',
+        'customer_column': 'o.kundennummer',
+        # Closed months may already be archived (utils.archive)
+        'history': True,
+    },
+    'inventory': {
+        'columns': ('internal_id', 'batch_number', 'product_name', 'color', 'size', 'supplier_name',
+                    'manufacturer', 'external_id', 'delivery_date', 'amount'),
+        'query': '''
+            SELECT internal_id, batch_number, product_name, color, size, supplier_name,
+                   manufacturer, external_id, delivery_date, amount
+            FROM charges
+            {where}
+            ORDER BY product_name, color, size, delivery_date
+        ''',
+        'date_column': 'delivery_date',
+        'customer_column': None,
+        'history': False,
+    },
+}
+
+
+def _build_query(dataset, date_from=None, date_to=None, kundennummer=None):
+    definition = DATASETS[dataset]
+    conditions, params = [], []
+    if date_from:
+        conditions.append(f"{definition['date_column']} >= %s")
+        params.append(str(date_from))
+    if date_to:
+        conditions.append(f"{definition['date_column']} < %s")
+        params.append(str(date_to))
+    if kundennummer:
+        if not definition['customer_column']:
+            raise ValueError(f"Dataset {dataset} cannot be filtered by customer")
+        conditions.append(f"{definition['customer_column']} = %s")
+        params.append(str(kundennummer))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return definition['query'].format(where=where), tuple(params)
+
+
+def iter_rows(dataset, date_from=None, date_to=None, kundennummer=None,
+              fetch_size=FETCH_SIZE, database=None):
+    """Yield the rows of a dataset chunk by chunk"""
+    database = database or db
+    query, params = _build_query(dataset, date_from, date_to, kundennummer)
+    query = database.adapt_query(query)
+
+    if DATASETS[dataset]['history']:
+        conn = open_history_connection(database, date_from, date_to)
+    else:
+        conn = database.get_connection(read_only=True)
+    try:
+        if database.use_sqlite:
+            cur = conn.cursor()
+        else:
+            # Named cursor: rows stay on the server until fetched
+            cur = conn.cursor(name=f"export_{uuid.uuid4().hex}")
+            cur.itersize = fetch_size
+        try:
+            cur.execute(query, params)
+            while True:
+                chunk = cur.fetchmany(fetch_size)
+                if not chunk:
+                    break
+                for row in chunk:
+                    yield tuple(row)
+        finally:
+            cur.close()
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+class _CsvWriter:
+    def __init__(self, path, compressed, delimiter):
+        if compressed:
+            self._file = gzip.open(path, 'wt', newline='', encoding='utf-8')
+        else:
+            # BOM so Excel detects UTF-8 (Umlaute in names)
+            self._file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self._writer = csv.writer(self._file, delimiter=delimiter)
+
+    def write(self, row):
+        self._writer.writerow(['' if v is None else v for v in row])
+
+    def close(self):
+        self._file.close()
+
+
+class _XlsxWriter:
+    def __init__(self, path, sheet_title):
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise RuntimeError("XLSX export requires openpyxl (pip install openpyxl)")
+        self.path = path
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet(sheet_title)
+
+    def write(self, row):
+        self._sheet.append([v if isinstance(v, (int, float, date, datetime)) or v is None else str(v)
+                            for v in row])
+
+    def close(self):
+        self._workbook.save(self.path)
+
+
+def _detect_format(path):
+    lower = path.lower()
+    if lower.endswith('.xlsx'):
+        return 'xlsx'
+    if lower.endswith('.gz'):
+        return 'csv.gz'
+    return 'csv'
+
+
+def export_dataset(dataset, path, fmt=None, date_from=None, date_to=None, kundennummer=None,
+                   fetch_size=FETCH_SIZE, delimiter=CSV_DELIMITER, database=None):
+    """Stream a dataset into a file; returns row count and throughput"""
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset: {dataset}")
+    fmt = fmt or _detect_format(path)
+    if fmt == 'xlsx':
+        writer = _XlsxWriter(path, dataset)
+    elif fmt in ('csv', 'csv.gz'):
+        writer = _CsvWriter(path, fmt == 'csv.gz', delimiter)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    started = time.perf_counter()
+    rows = 0
+    try:
+        writer.write(DATASETS[dataset]['columns'])
+        for row in iter_rows(dataset, date_from, date_to, kundennummer, fetch_size, database):
+            writer.write(row)
+            rows += 1
+    finally:
+        writer.close()
+
+    seconds = time.perf_counter() - started
+    report = {
+        'dataset': dataset,
+        'path': path,
+        'format': fmt,
+        'rows': rows,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(rows / seconds, 1) if seconds else 0.0,
+    }
+    logger.info(f"Export finished: {report}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export orders or inventory")
+    parser.add_argument('dataset', choices=sorted(DATASETS))
+    parser.add_argument('path', help="output file (.csv, .csv.gz or .xlsx)")
+    parser.add_argument('--from', dest='date_from', help="start date, inclusive (YYYY-MM-DD)")
+    parser.add_argument('--to', dest='date_to', help="end date, exclusive (YYYY-MM-DD)")
+    parser.add_argument('--kunde', dest='kundennummer', help="only this customer (orders)")
+    args = parser.parse_args()
+    print(export_dataset(args.dataset, args.path, date_from=args.date_from, date_to=args.date_to,
+                         kundennummer=args.kundennummer))
+
+
+if __name__ == "__main__":
+    main()
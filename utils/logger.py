@@ -0,0 +1,325 @@
+import os
+import sys
+import copy
+import gzip
+import time
+import queue
+import atexit
+import shutil
+import logging
+import threading
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FILE = os.getenv('TASSEN_LOG_FILE', 'system.log')
+LOG_LEVEL = os.getenv('TASSEN_LOG_LEVEL', 'INFO')
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+LOG_MAX_BYTES = int(os.getenv('TASSEN_LOG_MAX_BYTES', 5 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('TASSEN_LOG_BACKUP_COUNT', 10))
+LOG_ROTATE_SECONDS = int(os.getenv('TASSEN_LOG_ROTATE_SECONDS', 24 * 60 * 60))
+LOG_DEDUP_SECONDS = float(os.getenv('TASSEN_LOG_DEDUP_SECONDS', 60))
+LOG_QUEUE_SIZE = 10000
+DEDUP_FLUSH_INTERVAL = 5    # seconds between checks for expired duplicate windows
+
+_setup_lock = threading.Lock()
+_queue_handler = None
+_listener = None
+_in_worker = False          # spawned worker: records go to the parent, not to LOG_FILE
+_worker_queue = None
+_worker_forwarder = None
+
+
+class CompressedRotatingFileHandler(RotatingFileHandler):
+    """Rotating file handler that rolls over by size and by age and gzips backups"""
+
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                 rotate_seconds=LOG_ROTATE_SECONDS):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count,
+                         encoding='utf-8', delay=True)
+        self.rotate_seconds = rotate_seconds
+        self.namer = self._gzip_name
+        self.rotator = self._gzip_rotate
+        # Age counts from the file's first record; the mtime moves on every
+        # restart and would postpone the rollover indefinitely
+        self.rollover_at = self._first_record_time() + rotate_seconds
+
+    def _first_record_time(self):
+        try:
+            with open(self.baseFilename, encoding='utf-8', errors='replace') as f:
+                first_line = f.readline()
+        except OSError:
+            return time.time()
+        try:
+            # LOG_FORMAT starts with asctime: '2026-10-19 07:40:18,185 - ...'
+            return time.mktime(time.strptime(first_line[:19], '%Y-%m-%d %H:%M:%S'))
+        except ValueError:
+            return os.path.getmtime(self.baseFilename)
+
+    @staticmethod
+    def _gzip_name(name):
+        return name + '.gz'
+
+    @staticmethod
+    def _gzip_rotate(source, dest):
+        with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+    def shouldRollover(self, record):
+        if self.rotate_seconds > 0 and time.time() >= self.rollover_at:
+            return os.path.exists(self.baseFilename)
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = time.time() + self.rotate_seconds
+
+
+class DuplicateFilter(logging.Filter):
+    """Suppress identical warnings/errors repeated within a time window"""
+
+    def __init__(self, window=LOG_DEDUP_SECONDS, min_level=logging.WARNING):
+        super().__init__()
+        self.window = window
+        self.min_level = min_level
+        self._seen = {}     # key -> (first_seen, suppressed, last suppressed record)
+
+    def filter(self, record):
+        if record.levelno < self.min_level or self.window <= 0:
+            return True
+
+        key = (record.name, record.levelno, record.getMessage())
+        now = record.created
+        first_seen, suppressed, _ = self._seen.get(key, (None, 0, None))
+
+        if first_seen is not None and now - first_seen < self.window:
+            self._seen[key] = (first_seen, suppressed + 1, record)
+            return False
+
+        self._seen[key] = (now, 0, None)
+        # The listener reports the suppressed count with the next occurrence
+        record.repeated = suppressed
+
+        # Keep the table bounded on long-running sessions
+        if len(self._seen) > 1000:
+            cutoff = now - self.window
+            self._seen = {k: v for k, v in self._seen.items() if v[0] >= cutoff or v[1]}
+        return True
+
+    def flush(self, now=None):
+        """Summary records for suppressed duplicates whose window has expired.
+
+        With now=None every pending count is reported (shutdown).
+        """
+        summaries = []
+        for key, (first_seen, suppressed, last) in list(self._seen.items()):
+            if now is not None and now - first_seen < self.window:
+                continue
+            del self._seen[key]
+            if suppressed:
+                summary = copy.copy(last)
+                summary.msg = f"{last.getMessage()} (repeated {suppressed} more times)"
+                summary.args = None
+                summaries.append(summary)
+        return summaries
+
+
+class DedupQueueListener(QueueListener):
+    """Queue listener that drops duplicates once before fanning out to handlers"""
+
+    def __init__(self, log_queue, *handlers, dedup_filter=None):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.dedup_filter = dedup_filter or DuplicateFilter()
+        self._handlers_lock = threading.Lock()
+        self._next_flush = time.time() + DEDUP_FLUSH_INTERVAL
+
+    def dequeue(self, block):
+        # Wake up periodically so counts of a duplicate that stopped are not held back
+        while True:
+            now = time.time()
+            if now >= self._next_flush:
+                self._next_flush = now + DEDUP_FLUSH_INTERVAL
+                self._emit_summaries(self.dedup_filter.flush(now))
+            if not block:
+                return self.queue.get(False)
+            try:
+                return self.queue.get(True, max(0.0, self._next_flush - now))
+            except queue.Empty:
+                continue
+
+    def stop(self):
+        super().stop()
+        # The listener thread is gone; report what is still being suppressed
+        self._emit_summaries(self.dedup_filter.flush())
+
+    def handle(self, record):
+        record = self.prepare(record)
+        unique = self.dedup_filter.filter(record)
+        display = record
+        if unique and getattr(record, 'repeated', 0):
+            display = copy.copy(record)
+            display.msg = f"{record.getMessage()} (repeated {record.repeated} more times)"
+            display.args = None
+
+        with self._handlers_lock:
+            handlers = self.handlers
+        for handler in handlers:
+            if record.levelno < handler.level:
+                continue
+            # Aggregating handlers (e.g. the error_log sink) count duplicates themselves
+            if getattr(handler, 'receives_duplicates', False):
+                handler.handle(record)
+            elif unique:
+                handler.handle(display)
+
+    def _emit_summaries(self, summaries):
+        if not summaries:
+            return
+        with self._handlers_lock:
+            handlers = self.handlers
+        for summary in summaries:
+            for handler in handlers:
+                # Aggregating handlers already saw every duplicate
+                if summary.levelno >= handler.level and not getattr(handler, 'receives_duplicates', False):
+                    handler.handle(summary)
+
+    def add_handler(self, handler):
+        with self._handlers_lock:
+            if handler not in self.handlers:
+                self.handlers = self.handlers + (handler,)
+
+    def remove_handler(self, handler):
+        with self._handlers_lock:
+            self.handlers = tuple(h for h in self.handlers if h is not handler)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Queue handler that never blocks the calling (UI) thread"""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Dropping a record is preferable to freezing the Tk loop
+            pass
+
+
+def _caller_name():
+    module = sys._getframe(2).f_globals.get('__name__', 'main')
+    if module == '__main__':
+        return 'main'
+    return module.rsplit('.', 1)[-1]
+
+
+def _configure():
+    global _queue_handler, _listener
+
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    file_handler = CompressedRotatingFileHandler(LOG_FILE)
+    file_handler.setFormatter(formatter)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    console_handler.setLevel(logging.WARNING)
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    _queue_handler = _NonBlockingQueueHandler(log_queue)
+    _listener = DedupQueueListener(log_queue, file_handler, console_handler)
+
+    root = logging.getLogger()
+    # Drop handlers stacked by earlier setup code or basicConfig()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener.start()
+    atexit.register(shutdown_logger)
+
+
+def setup_logger(name=None):
+    """Return a named logger; the queue pipeline is set up once per process"""
+    if name is None:
+        name = _caller_name()
+
+    with _setup_lock:
+        if _listener is None and not _in_worker:
+            _configure()
+
+    return logging.getLogger(name)
+
+
+def worker_log_queue():
+    """Queue for the records of spawned worker processes (see init_worker_logging).
+
+    A thread of this process feeds them into the regular pipeline, so only
+    one process ever writes LOG_FILE.
+    """
+    global _worker_queue, _worker_forwarder
+
+    setup_logger('logger')
+    with _setup_lock:
+        if _worker_queue is None:
+            _worker_queue = multiprocessing.get_context('spawn').Queue(LOG_QUEUE_SIZE)
+            _worker_forwarder = threading.Thread(
+                target=_forward_worker_records, args=(_worker_queue,), name='worker-log-forwarder', daemon=True)
+            _worker_forwarder.start()
+    return _worker_queue
+
+
+def _forward_worker_records(worker_queue):
+    while True:
+        try:
+            record = worker_queue.get()
+        except (EOFError, OSError):
+            break
+        if record is None:
+            break
+        logging.getLogger(record.name).handle(record)
+
+
+def init_worker_logging(worker_queue):
+    """Process pool initializer: send the worker's records to the parent process"""
+    global _in_worker
+
+    with _setup_lock:
+        _in_worker = True
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(worker_queue))
+    root.setLevel(LOG_LEVEL)
+
+
+def add_log_handler(handler):
+    """Attach an extra handler to the background listener thread"""
+    setup_logger('logger')
+    _listener.add_handler(handler)
+
+
+def remove_log_handler(handler):
+    if _listener is not None:
+        _listener.remove_handler(handler)
+
+
+def shutdown_logger():
+    """Flush pending records and stop the background listener"""
+    global _listener, _queue_handler, _worker_queue, _worker_forwarder
+
+    if _worker_forwarder is not None:
+        # Forward what the workers sent before the listener goes away
+        _worker_queue.put(None)
+        _worker_forwarder.join(timeout=2)
+        _worker_queue = None
+        _worker_forwarder = None
+
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener = None
+        _queue_handler = None
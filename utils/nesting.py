@@ -0,0 +1,320 @@
+"""2-D nesting of print files onto roll media.
+
+Pieces are laid out on a strip of fixed width and unlimited length. Two
+heuristics are available:
+
+* ``maxrects``  - MaxRects with the bottom-left rule; tightest layouts
+* ``guillotine`` - guillotine splits with best-area fit; fastest for small
+  batches, but its free list is never merged and grows with the batch
+
+All dimensions are in centimetres, like ``breite``/``hoehe`` in ``files``.
+"""
+import os
+import json
+from collections import namedtuple
+from database import db
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+ROLL_WIDTH_CM = float(os.getenv('TASSEN_ROLL_WIDTH_CM', 160))
+NESTING_MARGIN_CM = float(os.getenv('TASSEN_NESTING_MARGIN_CM', 0.5))
+
+Piece = namedtuple('Piece', 'file_id kunden_id dateiname width height')
+Placement = namedtuple('Placement', 'piece x y width height rotated')
+Rect = namedtuple('Rect', 'x y width height')
+
+_EPS = 1e-9     # split edges are float sums and may miss the exact edge of `used`
+
+
+class NestingLayout:
+    """Result of a nesting run"""
+
+    def __init__(self, roll_width, margin, placements, unplaced, heuristic):
+        self.roll_width = roll_width
+        self.margin = margin
+        self.placements = placements
+        self.unplaced = unplaced
+        self.heuristic = heuristic
+
+    @property
+    def length_cm(self):
+        if not self.placements:
+            return 0.0
+        return max(p.y + p.height for p in self.placements) + self.margin
+
+    @property
+    def metres(self):
+        return round(self.length_cm / 100, 3)
+
+    @property
+    def used_area_cm2(self):
+        return sum(p.width * p.height for p in self.placements)
+
+    @property
+    def utilisation(self):
+        """Share of the consumed roll area covered by prints (0..1)"""
+        total = self.roll_width * self.length_cm
+        return self.used_area_cm2 / total if total else 0.0
+
+    def summary(self):
+        return {
+            'heuristic': self.heuristic,
+            'roll_width_cm': self.roll_width,
+            'margin_cm': self.margin,
+            'pieces': len(self.placements),
+            'unplaced': len(self.unplaced),
+            'length_m': self.metres,
+            'print_area_m2': round(self.used_area_cm2 / 10000, 3),
+            'utilisation': round(self.utilisation, 4),
+        }
+
+    def to_dict(self):
+        data = self.summary()
+        data['placements'] = [
+            {
+                'file_id': p.piece.file_id,
+                'kunden_id': p.piece.kunden_id,
+                'dateiname': p.piece.dateiname,
+                'x_cm': round(p.x, 2),
+                'y_cm': round(p.y, 2),
+                'width_cm': round(p.width, 2),
+                'height_cm': round(p.height, 2),
+                'rotated': p.rotated,
+            }
+            for p in self.placements
+        ]
+        data['unplaced'] = [piece._asdict() for piece in self.unplaced]
+        return data
+
+    def export(self, path):
+        """Write the layout as JSON for the print workflow"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+        logger.info(f"Nesting layout exported: {path}")
+        return path
+
+    def to_order_data(self):
+        """Layout rows in the order_data format of PrintManager.print_order"""
+        return [
+            {'beschreibung': (
+                f"{os.path.basename(p.piece.dateiname)} {p.width:g}x{p.height:g} "
+                f"@ x={p.x:.1f} y={p.y:.1f}{' (gedreht)' if p.rotated else ''}"
+            )}
+            for p in sorted(self.placements, key=lambda p: (p.y, p.x))
+        ]
+
+
+class _MaxRectsBin:
+    """Free-space bookkeeping for MaxRects on an open-ended strip"""
+
+    def __init__(self, width, height, min_size=0.0):
+        self.free = [Rect(0.0, 0.0, width, height)]
+        # Slivers no remaining piece fits into are dropped right away
+        self.min_size = min_size
+
+    def find(self, width, height, allow_rotation):
+        # Runs once per piece over the whole free list, so the loop is kept flat
+        best = None
+        best_top = best_x = 0.0
+        rotate = allow_rotation and width != height
+        for x, y, w, h in self.free:
+            # Bottom-left rule keeps the used roll length short
+            if width <= w and height <= h:
+                top = y + height
+                if best is None or top < best_top or (top == best_top and x < best_x):
+                    best, best_top, best_x = (x, y, width, height, False), top, x
+            if rotate and height <= w and width <= h:
+                top = y + width
+                if best is None or top < best_top or (top == best_top and x < best_x):
+                    best, best_top, best_x = (x, y, height, width, True), top, x
+        if best is None:
+            return None
+        return (best_top, best_x), Rect(*best[:4]), best[4]
+
+    def place(self, used):
+        ux, uy = used.x, used.y
+        ur, ut = ux + used.width, uy + used.height
+        lo_x, lo_y, hi_x, hi_y = ux - _EPS, uy - _EPS, ur + _EPS, ut + _EPS
+        new_free = []
+        kept = []
+        touching = []
+        min_size = self.min_size
+        for rect in self.free:
+            x, y, w, h = rect
+            right, top = x + w, y + h
+            if ux >= right or ur <= x or uy >= top or ut <= y:
+                kept.append(rect)
+                if x <= hi_x and right >= lo_x and y <= hi_y and top >= lo_y:
+                    touching.append(rect)
+                continue
+            if ux > x:
+                new_free.append(Rect(x, y, ux - x, h))
+            if ur < right:
+                new_free.append(Rect(ur, y, right - ur, h))
+            if uy > y:
+                new_free.append(Rect(x, y, w, uy - y))
+            if ut < top:
+                new_free.append(Rect(x, ut, w, top - ut))
+
+        # The free list only holds maximal rectangles and every new one lies
+        # inside the rectangle it was split from, so no kept rectangle can be
+        # inside a new one. A new one touches `used`, so only kept rectangles
+        # touching `used` can contain it.
+        new_free = [r for r in new_free if r.width >= min_size and r.height >= min_size]
+        pruned = []
+        for i, rect in enumerate(new_free):
+            contained = any(_contains(other, rect) for other in touching)
+            if not contained:
+                contained = any(
+                    j != i and _contains(other, rect) and (other != rect or j < i)
+                    for j, other in enumerate(new_free)
+                )
+            if not contained:
+                pruned.append(rect)
+        kept.extend(pruned)
+        self.free = kept
+
+
+class _GuillotineBin:
+    """Free-space bookkeeping with guillotine splits"""
+
+    def __init__(self, width, height, min_size=0.0):
+        self.free = [Rect(0.0, 0.0, width, height)]
+        self.min_size = min_size
+
+    def find(self, width, height, allow_rotation):
+        best = None
+        best_top = best_waste = 0.0
+        rotate = allow_rotation and width != height
+        area = width * height
+        for index, (x, y, w, h) in enumerate(self.free):
+            if width <= w and height <= h:
+                top, waste = y + height, w * h - area
+                if best is None or top < best_top or (top == best_top and waste < best_waste):
+                    best, best_top, best_waste = (x, y, width, height, False, index), top, waste
+            if rotate and height <= w and width <= h:
+                top, waste = y + width, w * h - area
+                if best is None or top < best_top or (top == best_top and waste < best_waste):
+                    best, best_top, best_waste = (x, y, height, width, True, index), top, waste
+        if best is None:
+            return None
+        return (best_top, best_waste), Rect(*best[:4]), best[4], best[5]
+
+    def place(self, used, index):
+        rect = self.free.pop(index)
+        right_w = rect.width - used.width
+        top_h = rect.height - used.height
+        # Split along the shorter leftover axis
+        if right_w < top_h:
+            right = Rect(rect.x + used.width, rect.y, right_w, used.height)
+            top = Rect(rect.x, rect.y + used.height, rect.width, top_h)
+        else:
+            right = Rect(rect.x + used.width, rect.y, right_w, rect.height)
+            top = Rect(rect.x, rect.y + used.height, used.width, top_h)
+        for split in (right, top):
+            if split.width >= self.min_size and split.height >= self.min_size:
+                self.free.append(split)
+
+
+def _contains(outer, inner):
+    return (inner.x >= outer.x and inner.y >= outer.y and
+            inner.x + inner.width <= outer.x + outer.width and
+            inner.y + inner.height <= outer.y + outer.height)
+
+
+class NestingEngine:
+    """Packs pieces onto a roll of fixed width"""
+
+    HEURISTICS = ('maxrects', 'guillotine')
+
+    def __init__(self, roll_width=ROLL_WIDTH_CM, margin=NESTING_MARGIN_CM,
+                 allow_rotation=True, heuristic='maxrects'):
+        if heuristic not in self.HEURISTICS:
+            raise ValueError(f"Unknown nesting heuristic: {heuristic}")
+        if roll_width <= 2 * margin:
+            raise ValueError("Roll width must be larger than the margins")
+        self.roll_width = roll_width
+        self.margin = margin
+        self.allow_rotation = allow_rotation
+        self.heuristic = heuristic
+
+    def pack(self, pieces):
+        """Lay out pieces and return a NestingLayout"""
+        margin = self.margin
+        # Each piece carries one margin as gap; the roll edges carry the rest
+        usable_width = self.roll_width - margin
+
+        valid, unplaced = [], []
+        for piece in pieces:
+            if not piece.width or not piece.height or piece.width <= 0 or piece.height <= 0:
+                unplaced.append(piece)
+            elif min(piece.width, piece.height) + margin > usable_width or (
+                    not self.allow_rotation and piece.width + margin > usable_width):
+                unplaced.append(piece)
+            else:
+                valid.append(piece)
+
+        # Large pieces first gives the heuristics room to fill gaps with small ones
+        valid.sort(key=lambda p: (max(p.width, p.height), p.width * p.height), reverse=True)
+        strip_length = sum(max(p.width, p.height) + margin for p in valid) + margin
+
+        min_size = min((min(p.width, p.height) + margin for p in valid), default=0.0)
+        if self.heuristic == 'maxrects':
+            free_space = _MaxRectsBin(usable_width, strip_length, min_size)
+        else:
+            free_space = _GuillotineBin(usable_width, strip_length, min_size)
+
+        placements = []
+        for piece in valid:
+            found = free_space.find(piece.width + margin, piece.height + margin, self.allow_rotation)
+            if found is None:
+                unplaced.append(piece)
+                continue
+            used, rotated = found[1], found[2]
+            if self.heuristic == 'maxrects':
+                free_space.place(used)
+            else:
+                free_space.place(used, found[3])
+            placements.append(Placement(
+                piece,
+                used.x + margin,
+                used.y + margin,
+                used.width - margin,
+                used.height - margin,
+                rotated,
+            ))
+
+        layout = NestingLayout(self.roll_width, margin, placements, unplaced, self.heuristic)
+        if unplaced:
+            logger.warning(f"Nesting: {len(unplaced)} pieces could not be placed")
+        return layout
+
+
+def load_unprinted_pieces(kunden_ids=None):
+    """Expand unprinted rows from the files table into pieces (one per copy)"""
+    query = '''
+        SELECT id, kunden_id, dateiname, breite, hoehe, anzahl
+        FROM files
+        WHERE (gedruckt IS NULL OR gedruckt = %s)
+    '''
+    params = [False]
+    if kunden_ids:
+        query += f" AND kunden_id IN ({', '.join(['%s'] * len(kunden_ids))})"
+        params.extend(kunden_ids)
+    query += " ORDER BY id"
+
+    rows = db.execute_query(query, tuple(params), fetch=True)
+    pieces = []
+    for file_id, kunden_id, dateiname, breite, hoehe, anzahl in rows:
+        piece = Piece(file_id, kunden_id, dateiname, float(breite or 0), float(hoehe or 0))
+        pieces.extend([piece] * max(1, int(anzahl or 1)))
+    return pieces
+
+
+def nest_unprinted_files(kunden_ids=None, **engine_options):
+    """Nest all unprinted files, optionally limited to some customers"""
+    pieces = load_unprinted_pieces(kunden_ids)
+    layout = NestingEngine(**engine_options).pack(pieces)
+    logger.info(f"Nesting of unprinted files: {layout.summary()}")
+    return layout
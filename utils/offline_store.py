@@ -0,0 +1,460 @@
+"""Offline mode for PostgreSQL installations.
+
+While PostgreSQL is unreachable:
+
+* writes (orders, customers) are appended to a local SQLite journal, each
+  with an idempotency key,
+* reads come from a local snapshot of stock and customers, which is also
+  updated optimistically by the journaled writes,
+* a background syncer reconnects, replays the journal in batches and marks
+  entries as synced or conflict.
+
+Replayed keys are recorded in ``sync_applied`` on the server inside the same
+transaction as the write, so a crash between commit and journal update can
+never apply an entry twice.
+"""
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from datetime import datetime
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+JOURNAL_PATH = os.getenv('TASSEN_OFFLINE_JOURNAL', 'offline_journal.db')
+SNAPSHOT_PATH = os.getenv('TASSEN_OFFLINE_SNAPSHOT', 'offline_snapshot.db')
+SYNC_INTERVAL = 10          # seconds between reconnect/replay attempts
+SNAPSHOT_INTERVAL = 300     # seconds between snapshot refreshes while online
+SYNC_BATCH_SIZE = 500
+
+# Idempotency keys already applied on the server (offline replay and API retries)
+SYNC_APPLIED_DDL = '''
+    CREATE TABLE IF NOT EXISTS sync_applied (
+        idempotency_key TEXT PRIMARY KEY,
+        applied_at TEXT
+    )
+'''
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class OfflineJournal:
+    """Append-only journal of writes made while offline"""
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS journal (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idempotency_key TEXT UNIQUE NOT NULL,
+                    operation TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_status ON journal (status, id)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        # An acknowledged offline order must survive a power cut
+        conn.execute("PRAGMA synchronous = FULL")
+        return conn
+
+    def append(self, operation, payload, idempotency_key=None):
+        """Store a write; appending the same key twice is a no-op. Returns the key."""
+        key = idempotency_key or uuid.uuid4().hex
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('''
+                    INSERT OR IGNORE INTO journal (idempotency_key, operation, payload, created_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (key, operation, json.dumps(payload, default=str), _now()))
+        finally:
+            conn.close()
+        logger.info(f"Journaled offline {operation}: {key}")
+        return key
+
+    def contains(self, idempotency_key):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT 1 FROM journal WHERE idempotency_key = ?",
+                                (idempotency_key,)).fetchone() is not None
+        finally:
+            conn.close()
+
+    def pending(self, limit=SYNC_BATCH_SIZE):
+        conn = self._connect()
+        try:
+            rows = conn.execute('''
+                SELECT id, idempotency_key, operation, payload
+                FROM journal WHERE status = 'pending'
+                ORDER BY id LIMIT ?
+            ''', (limit,)).fetchall()
+        finally:
+            conn.close()
+        return [
+            {'id': row[0], 'idempotency_key': row[1], 'operation': row[2], 'payload': json.loads(row[3])}
+            for row in rows
+        ]
+
+    def mark(self, results):
+        """results: iterable of (journal id, status, error)"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany('''
+                    UPDATE journal SET status = ?, error = ?, attempts = attempts + 1
+                    WHERE id = ?
+                ''', [(status, error, entry_id) for entry_id, status, error in results])
+        finally:
+            conn.close()
+
+    def counts(self):
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM journal GROUP BY status").fetchall())
+        finally:
+            conn.close()
+
+    def conflicts(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute('''
+                SELECT id, idempotency_key, operation, payload, error
+                FROM journal WHERE status = 'conflict' ORDER BY id
+            ''').fetchall()
+        finally:
+            conn.close()
+        keys = ('id', 'idempotency_key', 'operation', 'payload', 'error')
+        return [dict(zip(keys, row)) for row in rows]
+
+
+class OfflineSnapshot:
+    """Local copy of stock and customers for reads while offline"""
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS products (
+                    product_name TEXT, color TEXT, size TEXT, amount INTEGER,
+                    PRIMARY KEY (product_name, color, size)
+                );
+                CREATE TABLE IF NOT EXISTS customers (
+                    kundennummer TEXT PRIMARY KEY, vorname TEXT, nachname TEXT,
+                    bestellnummer TEXT, quadratmeter REAL
+                );
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            ''')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def refreshed_at(self):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'refreshed_at'").fetchone()
+        finally:
+            conn.close()
+        return datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S') if row else None
+
+    def refresh(self, database):
+        """Replace the snapshot with the current server state"""
+        products = database.execute_query('''
+            SELECT product_name, color, size, SUM(amount)
+            FROM charges
+            GROUP BY product_name, color, size
+        ''', fetch=True)
+        customers = database.execute_query('''
+            SELECT kundennummer, vorname, nachname, bestellnummer, quadratmeter FROM customers
+        ''', fetch=True)
+
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM products")
+                    conn.execute("DELETE FROM customers")
+                    conn.executemany("INSERT INTO products VALUES (?, ?, ?, ?)",
+                                     [tuple(row) for row in products])
+                    conn.executemany("INSERT INTO customers VALUES (?, ?, ?, ?, ?)",
+                                     [(r[0], r[1], r[2], r[3], float(r[4] or 0.0)) for r in customers])
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('refreshed_at', ?)", (_now(),))
+            finally:
+                conn.close()
+        logger.info(f"Offline snapshot refreshed: {len(products)} products, {len(customers)} customers")
+
+    def load_products(self):
+        conn = self._connect()
+        try:
+            return conn.execute('''
+                SELECT product_name, color, size, amount FROM products
+                WHERE amount > 0 ORDER BY product_name, color, size
+            ''').fetchall()
+        finally:
+            conn.close()
+
+    def check_stock(self, product_name, quantity, color, size):
+        conn = self._connect()
+        try:
+            row = conn.execute('''
+                SELECT amount FROM products
+                WHERE product_name = ? AND color = ? AND size = ? AND amount >= ?
+            ''', (product_name, color, size, quantity)).fetchone()
+        finally:
+            conn.close()
+        return row is not None
+
+    def reserve_stock(self, items):
+        """Book items against the snapshot; returns the first item short of stock or None"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                for item in items:
+                    product_name, quantity, color, size = item
+                    cur = conn.execute('''
+                        UPDATE products SET amount = amount - ?
+                        WHERE product_name = ? AND color = ? AND size = ? AND amount >= ?
+                    ''', (quantity, product_name, color, size, quantity))
+                    if cur.rowcount == 0:
+                        conn.rollback()
+                        return item
+                conn.commit()
+                return None
+            finally:
+                conn.close()
+
+    def release_stock(self, items):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany('''
+                        UPDATE products SET amount = amount + ?
+                        WHERE product_name = ? AND color = ? AND size = ?
+                    ''', [(q, p, c, s) for p, q, c, s in items])
+            finally:
+                conn.close()
+
+    def load_customer(self, kundennummer):
+        conn = self._connect()
+        try:
+            row = conn.execute('''
+                SELECT kundennummer, vorname, nachname, bestellnummer, quadratmeter
+                FROM customers WHERE kundennummer = ?
+            ''', (kundennummer,)).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        keys = ('kundennummer', 'vorname', 'nachname', 'bestellnummer', 'quadratmeter')
+        return dict(zip(keys, row))
+
+    def upsert_customer(self, customer):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO customers VALUES (?, ?, ?, ?, ?)", (
+                        customer['kundennummer'], customer.get('vorname'), customer.get('nachname'),
+                        customer.get('bestellnummer'), float(customer.get('quadratmeter') or 0.0)))
+            finally:
+                conn.close()
+
+    def count_order_numbers(self, prefix):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM customers WHERE bestellnummer LIKE ?",
+                                (f"{prefix}%",)).fetchone()[0]
+        finally:
+            conn.close()
+
+
+class OfflineSyncer(threading.Thread):
+    """Background thread that reconnects and replays the journal"""
+
+    def __init__(self, store):
+        super().__init__(name='offline-syncer', daemon=True)
+        self.store = store
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(SYNC_INTERVAL):
+            try:
+                self.store.sync()
+            except Exception as e:
+                logger.error(f"Offline sync error: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class OfflineStore:
+    """Journal, snapshot and syncer for one DatabaseManager"""
+
+    def __init__(self, database, service, journal_path=JOURNAL_PATH, snapshot_path=SNAPSHOT_PATH,
+                 start_syncer=True):
+        self.db = database
+        self.service = service
+        self.journal = OfflineJournal(journal_path)
+        self.snapshot = OfflineSnapshot(snapshot_path)
+        self._sync_lock = threading.Lock()
+        self.syncer = OfflineSyncer(self)
+        if start_syncer:
+            self.syncer.start()
+
+    # ------------------------------------------------------------------
+    # Offline writes
+    # ------------------------------------------------------------------
+    def journal_order(self, kundennummer, items, idempotency_key=None):
+        """Book an order locally; returns (key, item short of stock or None)"""
+        if idempotency_key and self.journal.contains(idempotency_key):
+            # Client retry of an order we already hold
+            return idempotency_key, None
+        short = self.snapshot.reserve_stock(items)
+        if short is not None:
+            return None, short
+        try:
+            # Replay may happen days later; keep when the order was actually taken
+            key = self.journal.append('save_order', {'kundennummer': kundennummer, 'items': items,
+                                                     'order_date': _now()}, idempotency_key)
+        except Exception:
+            self.snapshot.release_stock(items)
+            raise
+        return key, None
+
+    def journal_customer(self, customer, idempotency_key=None):
+        # The server row as we knew it, to detect concurrent edits on replay
+        base = self.snapshot.load_customer(customer['kundennummer'])
+        key = self.journal.append('save_customer', {'customer': customer, 'base': base}, idempotency_key)
+        self.snapshot.upsert_customer(customer)
+        return key
+
+    # ------------------------------------------------------------------
+    # Sync
+    # ------------------------------------------------------------------
+    def sync(self):
+        """Reconnect if needed, replay pending entries and refresh the snapshot"""
+        with self._sync_lock:
+            if self.db.offline:
+                if not self.db.try_reconnect():
+                    return 0
+                self.service.run_deferred_schema()
+
+            replayed = 0
+            while True:
+                entries = self.journal.pending(SYNC_BATCH_SIZE)
+                if not entries:
+                    break
+                if not self._replay_batch(entries):
+                    return replayed
+                replayed += len(entries)
+
+            refreshed = self.snapshot.refreshed_at()
+            if replayed or refreshed is None or (datetime.now() - refreshed).total_seconds() > SNAPSHOT_INTERVAL:
+                self.snapshot.refresh(self.db)
+            if replayed:
+                logger.info(f"Offline journal replayed: {replayed} entries, {self.journal.counts()}")
+            return replayed
+
+    def _replay_batch(self, entries):
+        try:
+            conn = self.db.get_connection()
+        except Exception as e:
+            if self.db.is_connection_error(e):
+                self.db.set_offline()
+                return False
+            raise
+
+        cur = conn.cursor()
+        results = []
+        try:
+            adapt = self.db.adapt_query
+            cur.execute(SYNC_APPLIED_DDL)
+            for entry in entries:
+                cur.execute("SAVEPOINT replay_entry")
+                try:
+                    cur.execute(adapt("SELECT 1 FROM sync_applied WHERE idempotency_key = %s"),
+                                (entry['idempotency_key'],))
+                    if cur.fetchone():
+                        cur.execute("RELEASE SAVEPOINT replay_entry")
+                        results.append((entry['id'], 'synced', None))
+                        continue
+
+                    conflict = self._apply(cur, entry)
+                    if conflict:
+                        cur.execute("ROLLBACK TO SAVEPOINT replay_entry")
+                        results.append((entry['id'], 'conflict', conflict))
+                        continue
+
+                    cur.execute(adapt("INSERT INTO sync_applied (idempotency_key, applied_at) VALUES (%s, %s)"),
+                                (entry['idempotency_key'], _now()))
+                    cur.execute("RELEASE SAVEPOINT replay_entry")
+                    results.append((entry['id'], 'synced', None))
+                except Exception as e:
+                    if self.db.is_connection_error(e):
+                        raise
+                    cur.execute("ROLLBACK TO SAVEPOINT replay_entry")
+                    results.append((entry['id'], 'conflict', str(e)))
+            conn.commit()
+        except Exception as e:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            if self.db.is_connection_error(e):
+                self.db.set_offline()
+                return False
+            logger.error(f"Error replaying offline journal: {e}")
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+        self.journal.mark(results)
+        conflicts = [r for r in results if r[1] == 'conflict']
+        if conflicts:
+            logger.warning(f"Offline sync conflicts: {[(r[0], r[2]) for r in conflicts]}")
+        return True
+
+    def _apply(self, cur, entry):
+        """Apply one journal entry; returns a conflict description or None"""
+        from utils.order_service import InsufficientStockError
+
+        payload = entry['payload']
+        if entry['operation'] == 'save_order':
+            try:
+                self.service._insert_order(cur, payload['kundennummer'],
+                                           [tuple(item) for item in payload['items']],
+                                           order_date=payload.get('order_date'))
+            except InsufficientStockError as e:
+                return str(e)
+            return None
+
+        if entry['operation'] == 'save_customer':
+            customer, base = payload['customer'], payload['base']
+            cur.execute(self.db.adapt_query('''
+                SELECT kundennummer, vorname, nachname, bestellnummer, quadratmeter
+                FROM customers WHERE kundennummer = %s
+            '''), (customer['kundennummer'],))
+            row = cur.fetchone()
+            if row is not None:
+                current = {'kundennummer': row[0], 'vorname': row[1], 'nachname': row[2],
+                           'bestellnummer': row[3], 'quadratmeter': float(row[4] or 0.0)}
+                if current != base:
+                    return "Kunde wurde zwischenzeitlich auf dem Server geändert"
+            self.service._upsert_customer(cur, customer)
+            return None
+
+        return f"Unbekannte Operation: {entry['operation']}"
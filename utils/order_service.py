@@ -0,0 +1,453 @@
+from datetime import datetime
+from database import db
+from utils.logger import setup_logger
+from utils.offline_store import OfflineStore, SYNC_APPLIED_DDL
+
+logger = setup_logger()
+
+
+class OrderValidationError(ValueError):
+    """Raised when an order is incomplete or malformed"""
+
+
+class InsufficientStockError(Exception):
+    """Raised when an order item exceeds the available stock"""
+
+    def __init__(self, product_name, color, size, quantity):
+        super().__init__(f"Nicht genügend Bestand für {product_name}")
+        self.product_name = product_name
+        self.color = color
+        self.size = size
+        self.quantity = quantity
+
+
+class OrderService:
+    """UI-free order, customer and stock logic shared by the Tk apps and the API"""
+
+    ITEM_FIELDS = ('product_name', 'quantity', 'color', 'size')
+
+    def __init__(self, database=None, offline=True):
+        self.db = database or db
+        self._customer_table_ready = False
+        self._order_table_ready = False
+        self._deferred_schema = set()
+        # Offline journal only makes sense for a remote PostgreSQL server
+        self.offline_store = OfflineStore(self.db, self) if offline and not self.db.use_sqlite else None
+
+    def is_offline(self):
+        return self.offline_store is not None and self.db.offline
+
+    def _write_connection(self):
+        """Open a connection for a write; None if the server just became unreachable"""
+        try:
+            return self.db.get_connection()
+        except Exception as e:
+            if self._handle_write_error(e):
+                return None
+            raise
+
+    def _handle_write_error(self, error):
+        """Switch to offline mode on connection loss; returns True if the write can be journaled"""
+        if self.offline_store is not None and self.db.is_connection_error(error):
+            self.db.set_offline()
+            return True
+        return False
+
+    # ------------------------------------------------------------------
+    # Schema
+    # ------------------------------------------------------------------
+    def _defer_schema(self, check, error=None):
+        """Postpone a schema check while offline; returns True if it was deferred"""
+        if error is not None and not self._handle_write_error(error):
+            return False
+        if not self.is_offline():
+            return False
+        self._deferred_schema.add(check)
+        logger.info(f"Offline: {check} postponed until the server is reachable")
+        return True
+
+    def run_deferred_schema(self):
+        """Run schema checks skipped during an outage; called after reconnect"""
+        for check in list(self._deferred_schema):
+            self._deferred_schema.discard(check)
+            getattr(self, check)()
+
+    def ensure_customer_table(self):
+        """Create the customers table once per process"""
+        if self._customer_table_ready or self._defer_schema('ensure_customer_table'):
+            return
+        try:
+            self._create_customer_table()
+        except Exception as e:
+            if self._defer_schema('ensure_customer_table', e):
+                return
+            raise
+        self._customer_table_ready = True
+
+    def _create_customer_table(self):
+        self.db.execute_query('''
+            CREATE TABLE IF NOT EXISTS customers (
+                kundennummer VARCHAR PRIMARY KEY,
+                vorname VARCHAR,
+                nachname VARCHAR,
+                bestellnummer VARCHAR UNIQUE,
+                quadratmeter NUMERIC,
+                dateien INTEGER,
+                barcode VARCHAR
+            )
+        ''')
+
+    def ensure_order_table(self):
+        """Create the cup_orders table once per process"""
+        if self._order_table_ready or self._defer_schema('ensure_order_table'):
+            return
+        try:
+            self._create_order_table()
+        except Exception as e:
+            if self._defer_schema('ensure_order_table', e):
+                return
+            raise
+        self._order_table_ready = True
+
+    def _create_order_table(self):
+        # Raw cursor: execute_query would rewrite the CURRENT_TIMESTAMP default
+        conn = self.db.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS cup_orders (
+                    id BIGSERIAL PRIMARY KEY,
+                    kundennummer VARCHAR(50) NOT NULL,
+                    product_name VARCHAR(100) NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    color VARCHAR(50),
+                    size VARCHAR(50),
+                    order_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cur.execute(SYNC_APPLIED_DDL)
+            conn.commit()
+        finally:
+            conn.close()
+        if not self.db.use_sqlite:
+            # Partitions only reach a few months ahead; extend them on every start
+            from utils.archive import ensure_partitions_postgres
+            ensure_partitions_postgres(database=self.db)
+
+    # ------------------------------------------------------------------
+    # Customers
+    # ------------------------------------------------------------------
+    def generate_order_number(self):
+        year = datetime.now().year
+        try:
+            if self.is_offline():
+                count = self.offline_store.snapshot.count_order_numbers(f"PRFX-{year}")
+                return f"PRFX-{year}{count+1:03d}"
+            query = "SELECT COUNT(*) FROM customers WHERE bestellnummer ILIKE %s"
+            result = self.db.execute_query(query, (f"PRFX-{year}%",), fetch=True)
+            if result and len(result) > 0 and result[0]:
+                count = result[0][0]
+            else:
+                count = 0
+            return f"PRFX-{year}{count+1:03d}"
+        except Exception as e:
+            logger.error(f"Error generating order number: {e}")
+            return f"PRFX-{year}001"  # Fallback
+
+    def save_customer(self, customer, idempotency_key=None):
+        """Insert or update a customer given as dict"""
+        if not customer.get('kundennummer'):
+            raise OrderValidationError("Kundennummer fehlt")
+
+        conn = None if self.is_offline() else self._write_connection()
+        if conn is not None:
+            cur = conn.cursor()
+            try:
+                self._upsert_customer(cur, customer)
+                conn.commit()
+                logger.info(f"Customer saved: {customer['kundennummer']}")
+                return
+            except Exception as e:
+                conn.rollback()
+                if not self._handle_write_error(e):
+                    raise
+            finally:
+                cur.close()
+                conn.close()
+
+        self.offline_store.journal_customer(customer, idempotency_key)
+        logger.info(f"Customer saved offline: {customer['kundennummer']}")
+
+    def _upsert_customer(self, cur, customer):
+        query = """
+            INSERT INTO customers
+            (kundennummer, vorname, nachname, bestellnummer, quadratmeter)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (kundennummer) DO UPDATE
+            SET vorname = %s, nachname = %s, bestellnummer = %s, quadratmeter = %s
+        """
+        values = (
+            customer.get('vorname'),
+            customer.get('nachname'),
+            customer.get('bestellnummer'),
+            customer.get('quadratmeter') or 0.0,
+        )
+        # Values needed twice for INSERT and UPDATE parts
+        cur.execute(self.db.adapt_query(query), (customer['kundennummer'],) + values + values)
+
+    def load_customer(self, kundennummer):
+        """Return the customer as dict or None"""
+        if self.is_offline():
+            return self.offline_store.snapshot.load_customer(kundennummer)
+        query = """
+            SELECT kundennummer, vorname, nachname, bestellnummer, quadratmeter
+            FROM customers WHERE kundennummer = %s
+        """
+        result = self.db.execute_query(query, (kundennummer,), fetch=True)
+        if not result:
+            return None
+        row = result[0]
+        return {
+            'kundennummer': row[0],
+            'vorname': row[1],
+            'nachname': row[2],
+            'bestellnummer': row[3],
+            'quadratmeter': float(row[4] or 0.0),
+        }
+
+    # ------------------------------------------------------------------
+    # Stock
+    # ------------------------------------------------------------------
+    def load_products(self):
+        """Return (product_name, color, size, amount) rows that are in stock"""
+        if self.is_offline():
+            return [tuple(product) for product in self.offline_store.snapshot.load_products()]
+        query = '''
+            SELECT product_name, color, size, amount
+            FROM charges
+            WHERE amount > 0
+            ORDER BY product_name, color, size
+        '''
+        products = self.db.execute_query(query, fetch=True)
+        logger.info(f"Retrieved {len(products) if products else 0} products from database")
+        return [tuple(product) for product in products or []]
+
+    def check_stock(self, product_name, quantity, color, size):
+        """Check if enough stock is available"""
+        try:
+            if self.is_offline():
+                return self.offline_store.snapshot.check_stock(product_name, quantity, color, size)
+            query = '''
+                SELECT amount
+                FROM charges
+                WHERE product_name = %s
+                AND color = %s
+                AND size = %s
+                AND amount >= %s
+            '''
+            result = self.db.execute_query(query, (product_name, color, size, quantity), fetch=True)
+            return bool(result)
+        except Exception as e:
+            logger.error(f"Error checking stock: {e}")
+            return False
+
+    # ------------------------------------------------------------------
+    # Orders
+    # ------------------------------------------------------------------
+    def validate_order(self, order):
+        """Normalize an order dict into (kundennummer, items) or raise OrderValidationError"""
+        if not isinstance(order, dict):
+            raise OrderValidationError("Bestellung muss ein Objekt sein")
+
+        kundennummer = str(order.get('kundennummer') or '').strip()
+        if not kundennummer:
+            raise OrderValidationError("Kundennummer fehlt")
+
+        items = order.get('items')
+        if not items or not isinstance(items, list):
+            raise OrderValidationError("Keine Produkte in der Bestellung")
+
+        normalized = []
+        for item in items:
+            if isinstance(item, (list, tuple)):
+                item = dict(zip(self.ITEM_FIELDS, item))
+            if not isinstance(item, dict) or not item.get('product_name'):
+                raise OrderValidationError("Produktname fehlt")
+            try:
+                quantity = int(item.get('quantity'))
+            except (TypeError, ValueError):
+                raise OrderValidationError(f"Ungültige Menge für {item['product_name']}")
+            if quantity <= 0:
+                raise OrderValidationError(f"Ungültige Menge für {item['product_name']}")
+            normalized.append((
+                item['product_name'],
+                quantity,
+                '' if item.get('color') is None else str(item['color']),
+                '' if item.get('size') is None else str(item['size']),
+            ))
+        return kundennummer, normalized
+
+    def _insert_order(self, cur, kundennummer, items, order_date=None):
+        """Insert one order on an open cursor; same stock rules as the Tk app.
+
+        order_date overrides the CURRENT_TIMESTAMP default (offline replay).
+        """
+        insert_query = self.db.adapt_query('''
+            INSERT INTO cup_orders
+            (kundennummer, product_name, quantity, color, size, order_date)
+            VALUES (%s, %s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))
+            RETURNING id
+        ''')
+        update_query = self.db.adapt_query('''
+            UPDATE charges
+            SET amount = amount - %s,
+                last_updated = CURRENT_TIMESTAMP
+            WHERE product_name = %s
+            AND color = %s
+            AND size = %s
+            AND amount >= %s
+            RETURNING amount
+        ''')
+
+        order_ids = []
+        for product_name, quantity, color, size in items:
+            cur.execute(insert_query, (kundennummer, product_name, quantity, color, size, order_date))
+            order_ids.append(cur.fetchone()[0])
+
+            cur.execute(update_query, (quantity, product_name, color, size, quantity))
+            if not cur.fetchone():
+                raise InsufficientStockError(product_name, color, size, quantity)
+        return order_ids
+
+    def _claim_key(self, cur, idempotency_key):
+        """Record an idempotency key in the open transaction.
+
+        Returns False if the key was already applied, so a retried request
+        does not insert the order a second time.
+        """
+        if not idempotency_key:
+            return True
+        cur.execute(self.db.adapt_query("SELECT 1 FROM sync_applied WHERE idempotency_key = %s"),
+                    (idempotency_key,))
+        if cur.fetchone():
+            return False
+        cur.execute(self.db.adapt_query(
+            "INSERT INTO sync_applied (idempotency_key, applied_at) VALUES (%s, %s)"),
+            (idempotency_key, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        return True
+
+    def save_order(self, kundennummer, items, idempotency_key=None):
+        """Save a single order atomically and return the new cup_orders ids.
+
+        While offline the order is journaled and an empty id list is returned,
+        as it is for a retry whose idempotency key was already applied.
+        """
+        kundennummer, items = self.validate_order({'kundennummer': kundennummer, 'items': items})
+
+        conn = None if self.is_offline() else self._write_connection()
+        if conn is not None:
+            cur = conn.cursor()
+            try:
+                if not self._claim_key(cur, idempotency_key):
+                    conn.rollback()
+                    logger.info(f"Order {idempotency_key} already saved, ignoring retry")
+                    return []
+                order_ids = self._insert_order(cur, kundennummer, items)
+                conn.commit()
+                logger.info(f"Order saved for customer {kundennummer}: {len(order_ids)} items")
+                return order_ids
+            except Exception as e:
+                conn.rollback()
+                if not self._handle_write_error(e):
+                    raise
+            finally:
+                cur.close()
+                conn.close()
+
+        self._journal_order(kundennummer, items, idempotency_key)
+        return []
+
+    def _journal_order(self, kundennummer, items, idempotency_key=None):
+        key, short = self.offline_store.journal_order(kundennummer, items, idempotency_key)
+        if short is not None:
+            product_name, quantity, color, size = short
+            raise InsufficientStockError(product_name, color, size, quantity)
+        logger.info(f"Order saved offline for customer {kundennummer}: {key}")
+        return key
+
+    def _save_orders_offline(self, orders):
+        results = []
+        for order in orders:
+            try:
+                kundennummer, items = self.validate_order(order)
+                key = self._journal_order(kundennummer, items, order.get('idempotency_key'))
+                results.append({'status': 'queued', 'idempotency_key': key})
+            except OrderValidationError as e:
+                results.append({'status': 'invalid', 'error': str(e)})
+            except InsufficientStockError as e:
+                results.append({'status': 'insufficient_stock', 'error': str(e)})
+        return results
+
+    def save_orders(self, orders):
+        """Save many orders in one transaction; each order is isolated by a savepoint.
+
+        Returns one result dict per order in input order. While offline the
+        orders are journaled and reported with status 'queued'. An order whose
+        idempotency_key was already applied is reported with status 'duplicate'.
+        """
+        if self.is_offline():
+            return self._save_orders_offline(orders)
+
+        conn = self._write_connection()
+        if conn is None:
+            return self._save_orders_offline(orders)
+        results = []
+        cur = conn.cursor()
+        try:
+            if self.db.use_sqlite and not conn.in_transaction:
+                # A SAVEPOINT outside a transaction would commit on RELEASE
+                cur.execute("BEGIN")
+            for index, order in enumerate(orders):
+                try:
+                    kundennummer, items = self.validate_order(order)
+                except OrderValidationError as e:
+                    results.append({'status': 'invalid', 'error': str(e)})
+                    continue
+
+                savepoint = f"order_{index}"
+                cur.execute(f"SAVEPOINT {savepoint}")
+                try:
+                    if not self._claim_key(cur, order.get('idempotency_key')):
+                        cur.execute(f"RELEASE SAVEPOINT {savepoint}")
+                        results.append({'status': 'duplicate', 'idempotency_key': order['idempotency_key']})
+                        continue
+                    order_ids = self._insert_order(cur, kundennummer, items)
+                    cur.execute(f"RELEASE SAVEPOINT {savepoint}")
+                    results.append({'status': 'ok', 'order_ids': order_ids})
+                except InsufficientStockError as e:
+                    cur.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                    results.append({'status': 'insufficient_stock', 'error': str(e)})
+                except Exception as e:
+                    cur.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                    logger.error(f"Error saving order for customer {kundennummer}: {e}",
+                                 extra={'kunden_id': kundennummer})
+                    results.append({'status': 'error', 'error': str(e)})
+            conn.commit()
+            saved = sum(1 for result in results if result['status'] == 'ok')
+            logger.info(f"Order batch committed: {saved}/{len(results)} orders saved")
+            return results
+        except Exception as e:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            if self._handle_write_error(e):
+                return self._save_orders_offline(orders)
+            logger.error(f"Error committing order batch: {e}")
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+
+order_service = OrderService()
@@ -0,0 +1,162 @@
+"""Background preview generation for print files.
+
+Thumbnails are rendered in a process pool (see utils.thumbnails), stored
+content-addressed under ``PREVIEW_CACHE_DIR`` and evicted least recently
+used first once the cache exceeds ``PREVIEW_CACHE_MAX_BYTES``. The Tk
+thread never waits: ``request()`` returns immediately and callbacks run
+from ``dispatch_ready()``, which the UI calls from ``root.after``.
+"""
+import os
+import time
+import queue
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from utils.logger import setup_logger, worker_log_queue, init_worker_logging
+from utils.thumbnails import render_thumbnail, THUMB_SIZE
+
+logger = setup_logger()
+
+PREVIEW_CACHE_DIR = os.getenv('TASSEN_PREVIEW_CACHE', '.preview_cache')
+PREVIEW_CACHE_MAX_BYTES = int(os.getenv('TASSEN_PREVIEW_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+PREVIEW_WORKERS = 2
+EVICT_EVERY = 25        # renders between cache size checks
+
+
+class PreviewCache:
+    def __init__(self, cache_dir=PREVIEW_CACHE_DIR, max_bytes=PREVIEW_CACHE_MAX_BYTES,
+                 workers=PREVIEW_WORKERS, size=THUMB_SIZE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.size = size
+        self._executor = None
+        self._pending = {}          # source path -> callbacks waiting for it
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._renders = 0
+        self._evicting = threading.Event()
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn: forking a process that runs Tk and logging threads is unsafe
+            # Workers log through the parent instead of opening LOG_FILE themselves
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker_logging, initargs=(worker_log_queue(),))
+            atexit.register(self.shutdown)
+        return self._executor
+
+    def request(self, path, callback):
+        """Queue a preview for path; callback(thumb_path or None) runs in dispatch_ready"""
+        with self._lock:
+            if path in self._pending:
+                self._pending[path].append(callback)
+                return
+            self._pending[path] = [callback]
+        try:
+            future = self._get_executor().submit(render_thumbnail, path, self.cache_dir, self.size)
+        except Exception as e:
+            logger.error(f"Error queuing preview for {path}: {e}")
+            self._results.put((path, None))
+            return
+        future.add_done_callback(lambda f, p=path: self._collect(p, f))
+
+    def _collect(self, path, future):
+        # Runs on the executor's management thread
+        try:
+            thumb, reason = future.result()
+            if thumb is None:
+                logger.info(f"No preview for {path}: {reason}")
+            elif reason == 'rendered':
+                with self._lock:
+                    # Done callbacks of several futures may run concurrently
+                    self._renders += 1
+                    evict = self._renders % EVICT_EVERY == 0
+                if evict:
+                    self.evict_async()
+        except Exception as e:
+            logger.warning(f"Preview generation failed for {path}: {e}")
+            thumb = None
+        self._results.put((path, thumb))
+
+    def dispatch_ready(self, limit=50):
+        """Run callbacks for finished previews; call from the Tk thread"""
+        handled = 0
+        while handled < limit:
+            try:
+                path, thumb = self._results.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                callbacks = self._pending.pop(path, [])
+            for callback in callbacks:
+                try:
+                    callback(thumb)
+                except Exception as e:
+                    logger.error(f"Error showing preview for {path}: {e}")
+            handled += 1
+        return handled
+
+    def evict_async(self):
+        if self._evicting.is_set():
+            return
+        self._evicting.set()
+        threading.Thread(target=self.evict, name='preview-evict', daemon=True).start()
+
+    def evict(self):
+        """Delete least recently used thumbnails until the cache fits max_bytes"""
+        try:
+            entries, total = [], 0
+            thumbs = os.path.join(self.cache_dir, 'thumbs')
+            for root, _, files in os.walk(thumbs):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+
+            removed = 0
+            if total > self.max_bytes:
+                entries.sort()
+                # Evict down to 90% so the next render does not trigger again
+                target = self.max_bytes * 0.9
+                for _, size, path in entries:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                        total -= size
+                        removed += 1
+                    except OSError:
+                        pass
+            if removed:
+                # Stale keys would only cause a re-render; drop the old ones anyway
+                self._prune_keys(time.time() - 30 * 24 * 3600)
+                logger.info(f"Preview cache evicted {removed} thumbnails, {total / 1024 / 1024:.1f} MB left")
+            return removed
+        except Exception as e:
+            logger.error(f"Error evicting preview cache: {e}")
+            return 0
+        finally:
+            self._evicting.clear()
+
+    def _prune_keys(self, older_than):
+        keys = os.path.join(self.cache_dir, 'keys')
+        for root, _, files in os.walk(keys):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < older_than:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
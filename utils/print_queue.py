@@ -0,0 +1,343 @@
+"""Print queue for unprinted files.
+
+Unprinted rows of ``files`` are grouped by medium, colour profile and size
+class into persistent ``print_jobs``. Jobs of the same medium run one after
+another on the same worker so the printer only changes media between
+lanes. Job state lives in the database:
+
+    queued -> printing -> done
+                       -> failed       (retry_failed() queues it again)
+    printing, heartbeat stale -> interrupted (operator decides: requeue or confirm)
+
+A worker claims a job by switching it from queued to printing with its
+owner id; while it prints it refreshes ``heartbeat_at``. A job whose owner
+stopped sending heartbeats (the process died) is never re-printed
+automatically, and files stay assigned to their job until it is done.
+Heartbeats are written and judged by the database clock (UTC), so
+workstations with drifting clocks cannot flag each other's jobs.
+"""
+import os
+import uuid
+import socket
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from database import db
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+DEFAULT_MEDIUM = 'Standard'
+DEFAULT_COLOR_PROFILE = 'Standard'
+MAX_FILES_PER_JOB = 200
+MAX_WORKERS = 2
+HEARTBEAT_SECONDS = 15
+HEARTBEAT_STALE_SECONDS = 120   # no heartbeat for this long: the owner is gone
+
+# Upper bound of the longer side in cm -> size class
+SIZE_CLASSES = ((30, 'klein'), (80, 'mittel'))
+LARGEST_SIZE_CLASS = 'gross'
+
+
+def size_class(breite, hoehe):
+    longest = max(float(breite or 0), float(hoehe or 0))
+    for limit, name in SIZE_CLASSES:
+        if longest <= limit:
+            return name
+    return LARGEST_SIZE_CLASS
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def default_printer(job, files):
+    """Send a job to PrintManager using the nesting layout of its files"""
+    from utils.print_manager import PrintManager
+    from utils.nesting import NestingEngine, Piece
+
+    pieces = []
+    for f in files:
+        piece = Piece(f['id'], f['kunden_id'], f['dateiname'], float(f['breite'] or 0), float(f['hoehe'] or 0))
+        pieces.extend([piece] * max(1, int(f['anzahl'] or 1)))
+    layout = NestingEngine().pack(pieces)
+
+    job_data = {
+        'kundennummer': ', '.join(sorted({str(f['kunden_id']) for f in files})),
+        'vorname': '',
+        'nachname': '',
+        'bestellnummer': f"DRUCKJOB-{job['id']}",
+        'quadratmeter': round(layout.used_area_cm2 / 10000, 3),
+    }
+    return PrintManager.print_order(layout.to_order_data(), job_data)
+
+
+def _db_now(database, offset_seconds=0):
+    """SQL expression for the database server's UTC clock as 'YYYY-MM-DD HH:MM:SS' text"""
+    if database.use_sqlite:
+        return f"datetime('now', '{offset_seconds:+d} seconds')"
+    return (f"to_char((NOW() AT TIME ZONE 'UTC') + INTERVAL '{offset_seconds} seconds', "
+            f"'YYYY-MM-DD HH24:MI:SS')")
+
+
+class PrintQueue:
+    """Persistent, media-batched print queue on top of the files table"""
+
+    def __init__(self, database=None, printer=None, max_workers=MAX_WORKERS,
+                 max_files_per_job=MAX_FILES_PER_JOB):
+        self.db = database or db
+        self.printer = printer or default_printer
+        self.max_workers = max_workers
+        self.max_files_per_job = max_files_per_job
+        # Identifies this process's claims across workstations sharing the database
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.ensure_schema()
+
+    def ensure_schema(self):
+        id_column = 'INTEGER PRIMARY KEY AUTOINCREMENT' if self.db.use_sqlite else 'BIGSERIAL PRIMARY KEY'
+        self.db.execute_query(f'''
+            CREATE TABLE IF NOT EXISTS print_jobs (
+                id {id_column},
+                medium TEXT NOT NULL,
+                farbprofil TEXT NOT NULL,
+                size_class TEXT NOT NULL,
+                status TEXT NOT NULL,
+                file_count INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at TEXT,
+                updated_at TEXT,
+                owner TEXT,
+                heartbeat_at TEXT
+            )
+        ''')
+        self.db.add_missing_columns('print_jobs', {
+            'owner': 'TEXT',
+            'heartbeat_at': 'TEXT',
+        })
+        self.db.execute_query(
+            "CREATE INDEX IF NOT EXISTS idx_print_jobs_status ON print_jobs (status)")
+        self.db.add_missing_columns('files', {
+            'medium': 'TEXT',
+            'farbprofil': 'TEXT',
+            'print_job_id': 'INTEGER',
+        })
+        self.db.execute_query(
+            "CREATE INDEX IF NOT EXISTS idx_files_print_job ON files (print_job_id)")
+
+    # ------------------------------------------------------------------
+    # Queue building
+    # ------------------------------------------------------------------
+    def recover(self):
+        """Flag printing jobs whose owner stopped sending heartbeats; they are not re-printed"""
+        # Jobs another live process is printing keep a fresh heartbeat and stay untouched
+        rows = self.db.execute_query(f'''
+            UPDATE print_jobs SET status = %s, updated_at = %s
+            WHERE status = %s
+            AND (heartbeat_at IS NULL OR heartbeat_at < {_db_now(self.db, -HEARTBEAT_STALE_SECONDS)})
+            RETURNING id
+        ''', ('interrupted', _now(), 'printing'), fetch=True)
+        if rows:
+            logger.warning(f"Print jobs interrupted by a crash, check manually: {[r[0] for r in rows]}")
+        return [r[0] for r in rows]
+
+    def enqueue_unprinted(self):
+        """Group unprinted, unassigned files into queued jobs; returns the new job ids"""
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(self.db.adapt_query('''
+                SELECT id, medium, farbprofil, breite, hoehe
+                FROM files
+                WHERE (gedruckt IS NULL OR gedruckt = %s)
+                AND print_job_id IS NULL
+                ORDER BY id
+            '''), (False,))
+            groups = {}
+            for file_id, medium, farbprofil, breite, hoehe in cur.fetchall():
+                key = (medium or DEFAULT_MEDIUM, farbprofil or DEFAULT_COLOR_PROFILE, size_class(breite, hoehe))
+                groups.setdefault(key, []).append(file_id)
+
+            insert_job = self.db.adapt_query('''
+                INSERT INTO print_jobs
+                (medium, farbprofil, size_class, status, file_count, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+            ''')
+
+            job_ids = []
+            assigned_total = 0
+            for (medium, farbprofil, size), file_ids in sorted(groups.items()):
+                for start in range(0, len(file_ids), self.max_files_per_job):
+                    chunk = file_ids[start:start + self.max_files_per_job]
+                    now = _now()
+                    cur.execute(insert_job, (medium, farbprofil, size, 'queued', len(chunk), now, now))
+                    job_id = cur.fetchone()[0]
+                    # Another workstation may have queued some of these files meanwhile
+                    cur.execute(self.db.adapt_query(f'''
+                        UPDATE files SET print_job_id = %s
+                        WHERE id IN ({', '.join(['%s'] * len(chunk))}) AND print_job_id IS NULL
+                        RETURNING id
+                    '''), [job_id] + chunk)
+                    assigned = len(cur.fetchall())
+                    if not assigned:
+                        cur.execute(self.db.adapt_query("DELETE FROM print_jobs WHERE id = %s"), (job_id,))
+                        continue
+                    if assigned < len(chunk):
+                        cur.execute(self.db.adapt_query(
+                            "UPDATE print_jobs SET file_count = %s WHERE id = %s"), (assigned, job_id))
+                    assigned_total += assigned
+                    job_ids.append(job_id)
+
+            # Jobs and file assignments become visible together or not at all
+            conn.commit()
+            if job_ids:
+                logger.info(f"Queued {len(job_ids)} print jobs for {assigned_total} files")
+            return job_ids
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error queueing print jobs: {e}")
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+    def pending_jobs(self):
+        rows = self.db.execute_query('''
+            SELECT id, medium, farbprofil, size_class, file_count, attempts
+            FROM print_jobs
+            WHERE status = %s
+            ORDER BY medium, farbprofil, size_class, id
+        ''', ('queued',), fetch=True)
+        keys = ('id', 'medium', 'farbprofil', 'size_class', 'file_count', 'attempts')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def job_files(self, job_id):
+        rows = self.db.execute_query('''
+            SELECT id, kunden_id, dateiname, breite, hoehe, anzahl, medium, farbprofil
+            FROM files WHERE print_job_id = %s ORDER BY id
+        ''', (job_id,), fetch=True)
+        keys = ('id', 'kunden_id', 'dateiname', 'breite', 'hoehe', 'anzahl', 'medium', 'farbprofil')
+        return [dict(zip(keys, row)) for row in rows]
+
+    # ------------------------------------------------------------------
+    # Dispatch
+    # ------------------------------------------------------------------
+    def dispatch(self):
+        """Print all queued jobs; one lane per medium, lanes run in parallel"""
+        lanes = {}
+        for job in self.pending_jobs():
+            lanes.setdefault(job['medium'], []).append(job)
+        if not lanes:
+            return {'done': 0, 'failed': 0}
+
+        results = {'done': 0, 'failed': 0}
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(stop,), name='print-heartbeat', daemon=True)
+        heartbeat.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='print-lane') as pool:
+                for lane_result in pool.map(self._run_lane, lanes.values()):
+                    results['done'] += lane_result['done']
+                    results['failed'] += lane_result['failed']
+        finally:
+            stop.set()
+            heartbeat.join()
+        logger.info(f"Print queue dispatched: {results}")
+        return results
+
+    def _heartbeat(self, stop):
+        """Refresh heartbeat_at of the jobs this process is printing"""
+        while not stop.wait(HEARTBEAT_SECONDS):
+            try:
+                self.db.execute_query(
+                    f"UPDATE print_jobs SET heartbeat_at = {_db_now(self.db)} WHERE owner = %s AND status = %s",
+                    (self.owner, 'printing'))
+            except Exception as e:
+                logger.error(f"Error updating print job heartbeat: {e}")
+
+    def _run_lane(self, jobs):
+        result = {'done': 0, 'failed': 0}
+        for job in jobs:
+            outcome = self._run_job(job)
+            if outcome is None:
+                continue
+            if outcome:
+                result['done'] += 1
+            else:
+                result['failed'] += 1
+        return result
+
+    def _run_job(self, job):
+        """Print one job; returns None if another worker claimed it first"""
+        # Persist "printing" before anything reaches the printer
+        claimed = self.db.execute_query(f'''
+            UPDATE print_jobs SET status = %s, attempts = attempts + 1, owner = %s,
+                heartbeat_at = {_db_now(self.db)}, updated_at = %s
+            WHERE id = %s AND status = %s
+            RETURNING id
+        ''', ('printing', self.owner, _now(), job['id'], 'queued'), fetch=True)
+        if not claimed:
+            logger.info(f"Print job {job['id']} was claimed by another worker, skipping")
+            return None
+
+        try:
+            self.printer(job, self.job_files(job['id']))
+        except Exception as e:
+            logger.error(f"Print job {job['id']} failed: {e}")
+            self.db.execute_query(
+                "UPDATE print_jobs SET status = %s, error = %s, updated_at = %s WHERE id = %s",
+                ('failed', str(e), _now(), job['id']))
+            return False
+
+        self.mark_done(job['id'])
+        return True
+
+    def mark_done(self, job_id):
+        """Set gedruckt for all files of a job and close the job in one transaction"""
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(self.db.adapt_query(
+                "UPDATE files SET gedruckt = %s WHERE print_job_id = %s"), (True, job_id))
+            cur.execute(self.db.adapt_query(
+                "UPDATE print_jobs SET status = %s, error = NULL, updated_at = %s WHERE id = %s"),
+                ('done', _now(), job_id))
+            conn.commit()
+            logger.info(f"Print job {job_id} done")
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error closing print job {job_id}: {e}")
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Operator actions
+    # ------------------------------------------------------------------
+    def confirm_job_printed(self, job_id):
+        """Close an interrupted job whose output came out of the printer"""
+        self.mark_done(job_id)
+
+    def requeue_job(self, job_id):
+        """Queue an interrupted or failed job again"""
+        self.db.execute_query('''
+            UPDATE print_jobs SET status = %s, updated_at = %s
+            WHERE id = %s AND status IN (%s, %s)
+        ''', ('queued', _now(), job_id, 'interrupted', 'failed'))
+
+    def retry_failed(self):
+        self.db.execute_query(
+            "UPDATE print_jobs SET status = %s, updated_at = %s WHERE status = %s",
+            ('queued', _now(), 'failed'))
+
+    def run_once(self):
+        """Recover, queue new files and print everything that is queued"""
+        self.recover()
+        self.enqueue_unprinted()
+        return self.dispatch()
+
+
+if __name__ == "__main__":
+    print(PrintQueue().run_once())
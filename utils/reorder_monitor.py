@@ -0,0 +1,399 @@
+"""Low-stock alerts and reorder proposals.
+
+Consumption per (product_name, color, size) is an exponentially decayed
+rate in cups per day (half-life ``HALF_LIFE_DAYS``). Each run folds only
+the orders not seen before into the rates, in the same transaction that
+marks them as seen, so every order is counted exactly once. Days of
+cover = current stock / current rate.
+
+SQLite: ``cup_orders`` has no AUTOINCREMENT, so rowids are reused once
+archival empties the table and cannot serve as a watermark. An insert
+trigger copies every order into ``reorder_log`` instead; each run folds
+and deletes the logged rows.
+
+PostgreSQL hands out ``id`` values before commit, so a lower id may
+become visible after a higher one: the ids of the last
+``COMMIT_LAG_SECONDS`` are kept in ``reorder_seen`` and the watermark
+only moves past ids seen longer ago than that.
+
+    python -m utils.reorder_monitor
+"""
+import math
+from datetime import datetime
+from database import db
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+HALF_LIFE_DAYS = 30
+LEAD_TIME_DAYS = 14     # supplier delivery time
+SAFETY_DAYS = 7
+COVER_DAYS = 30         # stock a reorder should last beyond the lead time
+BATCH_SIZE = 5000
+COMMIT_LAG_SECONDS = 600    # longer than any order transaction stays open
+REBUILD_HISTORY_DAYS = 12 * HALF_LIFE_DAYS    # older orders add less than 1/4096 of their rate
+UNKNOWN_SUPPLIER = 'Unbekannt'
+
+_DECAY = math.log(2) / (HALF_LIFE_DAYS * 86400)   # per second
+
+
+def _epoch(value):
+    if value is None:
+        return datetime.now().timestamp()
+    if isinstance(value, str):
+        # SQLite stores timestamps as text
+        return datetime.fromisoformat(value.strip()).timestamp()
+    return value.timestamp()
+
+
+def _timestamp(epoch):
+    return datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class ReorderMonitor:
+    def __init__(self, database=None, lead_time_days=LEAD_TIME_DAYS, safety_days=SAFETY_DAYS,
+                 cover_days=COVER_DAYS, pack_size=1):
+        self.db = database or db
+        self.lead_time_days = lead_time_days
+        self.safety_days = safety_days
+        self.cover_days = cover_days
+        self.pack_size = max(1, int(pack_size))
+        self.commit_lag = COMMIT_LAG_SECONDS
+        self.ensure_schema()
+
+    def ensure_schema(self):
+        self.db.execute_query('''
+            CREATE TABLE IF NOT EXISTS reorder_rates (
+                product_name VARCHAR(100) NOT NULL,
+                color VARCHAR(50) NOT NULL,
+                size VARCHAR(50) NOT NULL,
+                rate REAL NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (product_name, color, size)
+            )
+        ''')
+        self.db.execute_query('''
+            CREATE TABLE IF NOT EXISTS reorder_meta (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        self.db.execute_query('''
+            CREATE TABLE IF NOT EXISTS reorder_seen (
+                order_id BIGINT PRIMARY KEY,
+                seen_at TEXT NOT NULL
+            )
+        ''')
+        if self.db.use_sqlite:
+            self._ensure_log_sqlite()
+
+    def _ensure_log_sqlite(self):
+        """Create reorder_log and the cup_orders insert trigger feeding it"""
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        try:
+            # One transaction: no order may slip in between trigger and backfill
+            cur.execute("BEGIN")
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS reorder_log (
+                    id INTEGER PRIMARY KEY,
+                    product_name TEXT,
+                    color TEXT,
+                    size TEXT,
+                    quantity INTEGER,
+                    order_date TEXT
+                )
+            ''')
+            cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'reorder_log_insert'")
+            if cur.fetchone() is None:
+                cur.execute('''
+                    CREATE TRIGGER reorder_log_insert AFTER INSERT ON cup_orders
+                    BEGIN
+                        INSERT INTO reorder_log (product_name, color, size, quantity, order_date)
+                        VALUES (NEW.product_name, NEW.color, NEW.size, NEW.quantity, NEW.order_date);
+                    END
+                ''')
+                # Orders above the watermark of older versions are not folded yet
+                cur.execute("SELECT value FROM reorder_meta WHERE name = ?", ('last_order_id',))
+                row = cur.fetchone()
+                cur.execute('''
+                    INSERT INTO reorder_log (product_name, color, size, quantity, order_date)
+                    SELECT product_name, color, size, quantity, order_date
+                    FROM cup_orders WHERE rowid > ? ORDER BY rowid
+                ''', (int(row[0]) if row else 0,))
+                cur.execute("DELETE FROM reorder_meta WHERE name = ?", ('last_order_id',))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error creating reorder log: {e}")
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Incremental rate update
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _decayed(rate, since, now):
+        """Rate at `now` of a rate last updated at `since`; events in the past add less"""
+        return rate * math.exp(-_DECAY * (now - since))
+
+    def watermark(self):
+        rows = self.db.execute_query(
+            "SELECT value FROM reorder_meta WHERE name = %s", ('last_order_id',), fetch=True)
+        return int(rows[0][0]) if rows else 0
+
+    def update(self, batch_size=BATCH_SIZE):
+        """Fold orders not seen before into the rates; returns the number processed"""
+        processed = 0
+        while True:
+            count = self._update_batch(batch_size)
+            processed += count
+            if count < batch_size:
+                break
+        if processed:
+            logger.info(f"Reorder monitor processed {processed} new order rows")
+        return processed
+
+    def _update_batch(self, batch_size):
+        if self.db.use_sqlite:
+            return self._update_log_batch(batch_size)
+        started = datetime.now().timestamp()
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(self.db.adapt_query(
+                "SELECT value FROM reorder_meta WHERE name = %s"), ('last_order_id',))
+            row = cur.fetchone()
+            last_id = int(row[0]) if row else 0
+
+            cur.execute(self.db.adapt_query('''
+                SELECT o.id, o.product_name, o.color, o.size, o.quantity, o.order_date
+                FROM cup_orders o
+                LEFT JOIN reorder_seen s ON s.order_id = o.id
+                WHERE o.id > %s AND s.order_id IS NULL
+                ORDER BY o.id
+                LIMIT %s
+            '''), (last_id, batch_size))
+            orders = cur.fetchall()
+
+            if orders:
+                self._fold(cur, orders)
+            cur.executemany(self.db.adapt_query(
+                "INSERT INTO reorder_seen (order_id, seen_at) VALUES (%s, %s)"),
+                [(order[0], _timestamp(started)) for order in orders])
+            if len(orders) < batch_size:
+                # All visible orders are folded; ids seen before the lag can have no late gaps
+                cur.execute(self.db.adapt_query(
+                    "SELECT MAX(order_id) FROM reorder_seen WHERE seen_at <= %s"),
+                    (_timestamp(started - self.commit_lag),))
+                settled = cur.fetchone()[0]
+                if settled is not None and settled > last_id:
+                    last_id = settled
+                    cur.execute(self.db.adapt_query(
+                        "DELETE FROM reorder_seen WHERE order_id <= %s"), (last_id,))
+
+            cur.execute(self.db.adapt_query('''
+                INSERT INTO reorder_meta (name, value) VALUES (%s, %s)
+                ON CONFLICT (name) DO UPDATE SET value = excluded.value
+            '''), ('last_order_id', str(last_id)))
+            conn.commit()
+            return len(orders)
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error updating consumption rates: {e}")
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+    def _update_log_batch(self, batch_size):
+        """SQLite: fold and delete the oldest rows of reorder_log"""
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(self.db.adapt_query('''
+                SELECT id, product_name, color, size, quantity, order_date
+                FROM reorder_log ORDER BY id LIMIT %s
+            '''), (batch_size,))
+            orders = cur.fetchall()
+            if orders:
+                self._fold(cur, orders)
+                cur.execute(self.db.adapt_query("DELETE FROM reorder_log WHERE id <= %s"), (orders[-1][0],))
+            conn.commit()
+            return len(orders)
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error updating consumption rates: {e}")
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+    def _fold(self, cur, orders):
+        """Add a batch of (key, product_name, color, size, quantity, order_date) rows to the rates"""
+        # Aggregate the batch in memory: one decayed sum per product
+        events = {}
+        for _, product_name, color, size, quantity, order_date in orders:
+            key = (product_name, color or '', size or '')
+            events.setdefault(key, []).append((_epoch(order_date), float(quantity or 0)))
+
+        keys = list(events)
+        current = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            condition = ' OR '.join(['(product_name = %s AND color = %s AND size = %s)'] * len(chunk))
+            cur.execute(self.db.adapt_query(
+                f"SELECT product_name, color, size, rate, updated_at FROM reorder_rates WHERE {condition}"),
+                [v for key in chunk for v in key])
+            for product_name, color, size, rate, updated_at in cur.fetchall():
+                current[(product_name, color, size)] = (rate, _epoch(updated_at))
+
+        rows = []
+        for key, product_events in events.items():
+            rate, updated = current.get(key, (0.0, None))
+            newest = max(t for t, _ in product_events)
+            reference = max(newest, updated or newest)
+            if updated is not None:
+                rate = self._decayed(rate, updated, reference)
+            for t, quantity in product_events:
+                # Each cup adds _DECAY cups/day-equivalent, decayed to the reference time
+                rate += quantity * _DECAY * 86400 * math.exp(-_DECAY * (reference - t))
+            rows.append(key + (rate, _timestamp(reference)))
+
+        cur.executemany(self.db.adapt_query('''
+            INSERT INTO reorder_rates (product_name, color, size, rate, updated_at)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (product_name, color, size)
+            DO UPDATE SET rate = excluded.rate, updated_at = excluded.updated_at
+        '''), rows)
+
+    def rebuild(self):
+        """Recompute all rates from the full order history"""
+        self.db.execute_query("DELETE FROM reorder_rates")
+        self.db.execute_query("DELETE FROM reorder_seen")
+        self.db.execute_query("DELETE FROM reorder_meta WHERE name = %s", ('last_order_id',))
+        if self.db.use_sqlite:
+            self._relog_sqlite()
+        return self._fold_archived() + self.update()
+
+    def _relog_sqlite(self):
+        """Replace reorder_log by every order currently in cup_orders"""
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute("BEGIN")
+            cur.execute("DELETE FROM reorder_log")
+            cur.execute('''
+                INSERT INTO reorder_log (product_name, color, size, quantity, order_date)
+                SELECT product_name, color, size, quantity, order_date FROM cup_orders ORDER BY rowid
+            ''')
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error rebuilding reorder log: {e}")
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+    def _fold_archived(self):
+        """Fold recent orders of closed months moved to the SQLite archive files"""
+        if not self.db.use_sqlite:
+            # PostgreSQL keeps archived months as partitions of cup_orders
+            return 0
+        from utils.archive import execute_history_query
+
+        since = _timestamp(datetime.now().timestamp() - REBUILD_HISTORY_DAYS * 86400)
+        orders = execute_history_query(
+            "SELECT 0, product_name, color, size, quantity, order_date FROM cup_orders_archived "
+            "WHERE order_date >= %s", (since,), database=self.db, date_from=since)
+        if not orders:
+            return 0
+        conn = self.db.get_connection()
+        cur = conn.cursor()
+        try:
+            self._fold(cur, orders)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error folding archived orders: {e}")
+            raise
+        finally:
+            cur.close()
+            conn.close()
+        return len(orders)
+
+    # ------------------------------------------------------------------
+    # Evaluation
+    # ------------------------------------------------------------------
+    def _stock(self):
+        rows = self.db.execute_query('''
+            SELECT product_name, color, size, SUM(amount), MIN(supplier_name)
+            FROM charges
+            GROUP BY product_name, color, size
+        ''', fetch=True, read_only=True)
+        return {(r[0], r[1] or '', r[2] or ''): (int(r[3] or 0), r[4]) for r in rows}
+
+    def status(self, now=None):
+        """Per-product stock, current rate and days of cover"""
+        now = now or datetime.now().timestamp()
+        stock = self._stock()
+        rates = self.db.execute_query(
+            "SELECT product_name, color, size, rate, updated_at FROM reorder_rates", fetch=True)
+
+        result = []
+        for product_name, color, size, rate, updated_at in rates:
+            key = (product_name, color, size)
+            amount, supplier = stock.get(key, (0, None))
+            rate = self._decayed(rate, _epoch(updated_at), max(now, _epoch(updated_at)))
+            result.append({
+                'product_name': product_name,
+                'color': color,
+                'size': size,
+                'stock': amount,
+                'rate_per_day': round(rate, 3),
+                'days_of_cover': round(amount / rate, 1) if rate > 1e-9 else None,
+                'supplier_name': supplier or UNKNOWN_SUPPLIER,
+            })
+        return result
+
+    def _reorder_quantity(self, stock, rate):
+        target = rate * (self.lead_time_days + self.safety_days + self.cover_days)
+        quantity = max(0, math.ceil(target - stock))
+        return -(-quantity // self.pack_size) * self.pack_size
+
+    def check(self, update=True):
+        """Low-stock alerts plus reorder proposals grouped by supplier_name"""
+        if update:
+            self.update()
+        threshold = self.lead_time_days + self.safety_days
+
+        alerts = []
+        proposals = {}
+        for item in self.status():
+            cover = item['days_of_cover']
+            if cover is None or cover >= threshold:
+                continue
+            item['reorder_quantity'] = self._reorder_quantity(item['stock'], item['rate_per_day'])
+            alerts.append(item)
+            if item['reorder_quantity']:
+                proposals.setdefault(item['supplier_name'], []).append(item)
+
+        alerts.sort(key=lambda i: i['days_of_cover'])
+        for item in alerts:
+            logger.warning(
+                f"Low stock: {item['product_name']} {item['color']} {item['size']} - "
+                f"{item['stock']} left, {item['days_of_cover']} days of cover")
+        return {'alerts': alerts, 'proposals': proposals}
+
+
+if __name__ == "__main__":
+    report = ReorderMonitor().check()
+    for supplier, items in sorted(report['proposals'].items()):
+        print(f"{supplier}:")
+        for item in items:
+            print(f"  {item['product_name']} {item['color']} {item['size']}: "
+                  f"{item['reorder_quantity']} Stück (Bestand {item['stock']}, "
+                  f"{item['days_of_cover']} Tage Reichweite)")
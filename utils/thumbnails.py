@@ -0,0 +1,114 @@
+"""Thumbnail rendering for the preview cache.
+
+Runs inside worker processes, so this module imports neither the
+database nor the logging pipeline. Raster images are rendered with
+Pillow, PDF/PS/EPS with Ghostscript; both are optional.
+"""
+import os
+import shutil
+import hashlib
+import subprocess
+
+THUMB_SIZE = (96, 96)
+HASH_CHUNK = 1024 * 1024
+GHOSTSCRIPT_TIMEOUT = 60
+VECTOR_EXTENSIONS = ('.pdf', '.ps', '.eps', '.ai')
+
+try:
+    from PIL import Image
+    Image.MAX_IMAGE_PIXELS = None   # print files are legitimately huge
+except ImportError:
+    Image = None
+
+
+def ghostscript_executable():
+    for name in ('gswin64c', 'gswin32c', 'gs'):
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+def stat_key(path):
+    """Cheap key from path, size and mtime; avoids rehashing unchanged files"""
+    st = os.stat(path)
+    return hashlib.sha1(f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}".encode('utf-8')).hexdigest()
+
+
+def content_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def thumb_path(cache_dir, digest):
+    return os.path.join(cache_dir, 'thumbs', digest[:2], f"{digest}.png")
+
+
+def _key_path(cache_dir, key):
+    return os.path.join(cache_dir, 'keys', key[:2], key)
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='ascii') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _render_raster(source, target, size):
+    with Image.open(source) as img:
+        img.draft('RGB', size)      # JPEG decodes at reduced scale
+        if img.mode not in ('RGB', 'RGBA'):
+            # CMYK / 16-bit TIFFs cannot be written as PNG directly
+            img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+        img.thumbnail(size, reducing_gap=2.0)
+        img.save(target, 'PNG', optimize=True)
+
+
+def _render_vector(source, target, size):
+    gs = ghostscript_executable()
+    if gs is None:
+        raise RuntimeError("Ghostscript not installed")
+    subprocess.run([
+        gs, '-q', '-dSAFER', '-dBATCH', '-dNOPAUSE', '-sDEVICE=png16m',
+        '-dFirstPage=1', '-dLastPage=1', '-dPDFFitPage', '-dFIXEDMEDIA',
+        f"-g{size[0]}x{size[1]}", f"-sOutputFile={target}", source,
+    ], check=True, timeout=GHOSTSCRIPT_TIMEOUT, capture_output=True)
+
+
+def render_thumbnail(source, cache_dir, size=THUMB_SIZE):
+    """Return (thumbnail path or None, reason). Safe to call in a worker process."""
+    key = stat_key(source)
+    key_file = _key_path(cache_dir, key)
+    try:
+        with open(key_file, encoding='ascii') as f:
+            digest = f.read().strip()
+    except OSError:
+        digest = content_digest(source)
+        _write_atomic(key_file, digest)
+
+    target = thumb_path(cache_dir, digest)
+    if os.path.exists(target):
+        os.utime(target)    # LRU: mtime is the last use
+        return target, 'hit'
+
+    vector = source.lower().endswith(VECTOR_EXTENSIONS)
+    if not vector and Image is None:
+        return None, 'Pillow not installed'
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = f"{target}.{os.getpid()}.tmp.png"
+    try:
+        if vector:
+            _render_vector(source, tmp, size)
+        else:
+            _render_raster(source, tmp, size)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return target, 'rendered'
@@ -0,0 +1,387 @@
+"""Opt-in responsiveness profiler for the Tk apps.
+
+Enabled with ``TASSEN_UI_PROFILE=1`` (``=cprofile`` also records a
+cProfile summary of slow actions). Every callback Tk calls back into
+Python (button commands, event bindings, ``after`` callbacks, variable
+traces) is timed; queries run on the Tk thread through
+``DatabaseManager.get_connection`` are attributed to the action that ran
+them. A heartbeat on the event loop measures how long the UI was frozen.
+
+Ctrl+Shift+P opens a live overlay; the slowest actions are written to
+``TASSEN_UI_PROFILE_FILE`` (default ui_profile.json) at exit.
+"""
+import os
+import io
+import json
+import time
+import heapq
+import atexit
+import pstats
+import cProfile
+import threading
+import functools
+import tkinter as tk
+from tkinter import ttk
+from collections import deque
+from datetime import datetime
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+PROFILE_MODE = os.getenv('TASSEN_UI_PROFILE', '')
+PROFILE_FILE = os.getenv('TASSEN_UI_PROFILE_FILE', 'ui_profile.json')
+HEARTBEAT_MS = 50
+STALL_THRESHOLD_MS = 100    # heartbeat later than this counts as a stall
+SLOW_ACTION_MS = 100        # actions above this are logged and cProfiled
+KEEP_SLOWEST = 50
+KEEP_RECENT = 1000
+KEEP_QUERIES = 20           # per action
+
+_profiler = None
+
+
+def _callback_name(func):
+    while isinstance(func, functools.partial):
+        func = func.func
+    name = getattr(func, '__qualname__', None) or repr(func)
+    code = getattr(func, '__code__', None)
+    if '<lambda>' in name and code is not None:
+        return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return name
+
+
+class _Action:
+    __slots__ = ('name', 'kind', 'started', 'wall', 'child', 'db_time', 'queries', 'profile')
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.wall = 0.0
+        self.child = 0.0
+        self.db_time = 0.0
+        self.queries = []
+        self.profile = None
+
+
+class _TimedCursor:
+    """Cursor proxy that books query time on the current action"""
+
+    def __init__(self, profiler, cursor):
+        self._profiler = profiler
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cursor.close()
+
+    def _timed(self, method, label, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return getattr(self._cursor, method)(*args, **kwargs)
+        finally:
+            self._profiler.record_query(label, time.perf_counter() - started)
+
+    def execute(self, query, *args, **kwargs):
+        return self._timed('execute', query, query, *args, **kwargs)
+
+    def executemany(self, query, *args, **kwargs):
+        return self._timed('executemany', query, query, *args, **kwargs)
+
+    def fetchone(self):
+        return self._timed('fetchone', 'fetchone')
+
+    def fetchmany(self, *args, **kwargs):
+        return self._timed('fetchmany', 'fetchmany', *args, **kwargs)
+
+    def fetchall(self):
+        return self._timed('fetchall', 'fetchall')
+
+
+class _TimedConnection:
+    def __init__(self, profiler, conn):
+        self._profiler = profiler
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def cursor(self, *args, **kwargs):
+        return _TimedCursor(self._profiler, self._conn.cursor(*args, **kwargs))
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return self._conn.commit()
+        finally:
+            self._profiler.record_query('COMMIT', time.perf_counter() - started)
+
+
+class UIProfiler:
+    def __init__(self, use_cprofile=False, output=PROFILE_FILE):
+        self.use_cprofile = use_cprofile
+        self.output = output
+        self.tk_thread = threading.get_ident()
+        self._stack = []
+        self._lock = threading.Lock()
+        self.recent = deque(maxlen=KEEP_RECENT)
+        self.slowest = []           # min-heap of (wall, seq, entry)
+        self.totals = {}            # name -> aggregate
+        self.stalls = deque(maxlen=KEEP_RECENT)
+        self.stall_total = 0.0
+        self.last_action = None
+        self._seq = 0
+        self._root = None
+        self._overlay = None
+        self._originals = {}
+
+    # ------------------------------------------------------------------
+    # Patching
+    # ------------------------------------------------------------------
+    def install(self):
+        from database import DatabaseManager
+
+        profiler = self
+        original_register = tk.Misc._register
+        original_after = tk.Misc.after
+        original_get_connection = DatabaseManager.get_connection
+        original_get_read_connection = DatabaseManager.get_read_connection
+        self._originals = {
+            (tk.Misc, '_register'): original_register,
+            (tk.Misc, 'after'): original_after,
+            (DatabaseManager, 'get_connection'): original_get_connection,
+            (DatabaseManager, 'get_read_connection'): original_get_read_connection,
+        }
+
+        def _register(widget, func, subst=None, needcleanup=1):
+            # after() callbacks are already wrapped under their real name
+            if getattr(func, '__name__', '') != 'callit' and not getattr(func, '_ui_profiled', False):
+                func = profiler.wrap(func, 'event' if subst else 'command')
+            profiler._ensure_heartbeat(widget)
+            return original_register(widget, func, subst, needcleanup)
+
+        def after(widget, ms, func=None, *args):
+            if func is not None and not getattr(func, '_ui_profiled', False):
+                func = profiler.wrap(func, 'after')
+            return original_after(widget, ms, func, *args)
+
+        def timed(original):
+            def get_connection(manager, *args, **kwargs):
+                conn = original(manager, *args, **kwargs)
+                # get_connection(read_only=True) returns an already timed read connection
+                if isinstance(conn, _TimedConnection):
+                    return conn
+                if conn is not None and profiler._stack and threading.get_ident() == profiler.tk_thread:
+                    return _TimedConnection(profiler, conn)
+                return conn
+            return get_connection
+
+        tk.Misc._register = _register
+        tk.Misc.after = after
+        DatabaseManager.get_connection = timed(original_get_connection)
+        DatabaseManager.get_read_connection = timed(original_get_read_connection)
+        atexit.register(self.dump)
+        logger.info(f"UI profiler enabled (cProfile: {self.use_cprofile})")
+
+    def uninstall(self):
+        for (owner, name), original in self._originals.items():
+            setattr(owner, name, original)
+        self._originals = {}
+
+    def wrap(self, func, kind):
+        name = _callback_name(func)
+
+        @functools.wraps(func)
+        def profiled(*args, **kwargs):
+            if threading.get_ident() != self.tk_thread:
+                return func(*args, **kwargs)
+            action = self._begin(name, kind)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._end(action)
+
+        profiled._ui_profiled = True
+        return profiled
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+    def _begin(self, name, kind):
+        action = _Action(name, kind)
+        # cProfile cannot nest, so only outermost actions are profiled
+        if self.use_cprofile and not self._stack:
+            action.profile = cProfile.Profile()
+            action.profile.enable()
+        self._stack.append(action)
+        return action
+
+    def _end(self, action):
+        action.wall = time.perf_counter() - action.started
+        if action.profile is not None:
+            action.profile.disable()
+        self._stack.pop()
+        if self._stack:
+            self._stack[-1].child += action.wall
+        self.last_action = action.name
+
+        entry = {
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'name': action.name,
+            'kind': action.kind,
+            'wall_ms': round(action.wall * 1000, 2),
+            'self_ms': round((action.wall - action.child) * 1000, 2),
+            'db_ms': round(action.db_time * 1000, 2),
+            'queries': action.queries,
+        }
+        if action.profile is not None and action.wall * 1000 >= SLOW_ACTION_MS:
+            out = io.StringIO()
+            pstats.Stats(action.profile, stream=out).sort_stats('cumulative').print_stats(20)
+            entry['profile'] = out.getvalue()
+
+        with self._lock:
+            self.recent.append(entry)
+            total = self.totals.setdefault(action.name, {
+                'name': action.name, 'kind': action.kind, 'count': 0,
+                'total_ms': 0.0, 'max_ms': 0.0, 'db_ms': 0.0})
+            total['count'] += 1
+            total['total_ms'] += entry['wall_ms']
+            total['max_ms'] = max(total['max_ms'], entry['wall_ms'])
+            total['db_ms'] += entry['db_ms']
+            self._seq += 1
+            item = (entry['wall_ms'], self._seq, entry)
+            if len(self.slowest) < KEEP_SLOWEST:
+                heapq.heappush(self.slowest, item)
+            elif item[0] > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+
+        if entry['wall_ms'] >= SLOW_ACTION_MS and len(self._stack) == 0:
+            logger.info(f"Slow UI action {action.name}: {entry['wall_ms']} ms, "
+                        f"DB {entry['db_ms']} ms in {len(action.queries)} queries")
+
+    def record_query(self, query, seconds):
+        if not self._stack:
+            return
+        action = self._stack[-1]
+        action.db_time += seconds
+        if len(action.queries) < KEEP_QUERIES:
+            action.queries.append({'query': ' '.join(str(query).split())[:200],
+                                   'ms': round(seconds * 1000, 2)})
+
+    # ------------------------------------------------------------------
+    # Event loop heartbeat
+    # ------------------------------------------------------------------
+    def _ensure_heartbeat(self, widget):
+        if self._root is not None:
+            return
+        try:
+            self._root = widget._root()
+        except Exception:
+            return
+        # Patterns with Shift need the uppercase keysym
+        self._root.bind_all('<Control-P>', lambda event: self.show_overlay(), add='+')
+        self._expected = time.perf_counter() + HEARTBEAT_MS / 1000
+        self._originals[(tk.Misc, 'after')](self._root, HEARTBEAT_MS, self._heartbeat)
+
+    def _heartbeat(self):
+        now = time.perf_counter()
+        late = (now - self._expected) * 1000
+        if late >= STALL_THRESHOLD_MS:
+            self.stall_total += late / 1000
+            with self._lock:
+                self.stalls.append({
+                    'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'stall_ms': round(late, 1),
+                    'last_action': self.last_action,
+                })
+        self._expected = now + HEARTBEAT_MS / 1000
+        try:
+            self._originals[(tk.Misc, 'after')](self._root, HEARTBEAT_MS, self._heartbeat)
+        except tk.TclError:
+            pass    # root destroyed
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+    def report(self):
+        with self._lock:
+            slowest = [entry for _, _, entry in sorted(self.slowest, reverse=True)]
+            totals = sorted(self.totals.values(), key=lambda t: t['max_ms'], reverse=True)
+            stalls = list(self.stalls)
+        return {
+            'stall_total_ms': round(self.stall_total * 1000, 1),
+            'stalls': stalls,
+            'actions': [dict(t, total_ms=round(t['total_ms'], 2), db_ms=round(t['db_ms'], 2)) for t in totals],
+            'slowest': slowest,
+        }
+
+    def dump(self, path=None):
+        path = path or self.output
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.report(), f, indent=2, ensure_ascii=False)
+            logger.info(f"UI profile written to {path}")
+        except Exception as e:
+            logger.error(f"Error writing UI profile: {e}")
+
+    def show_overlay(self):
+        if self._overlay is not None and self._overlay.winfo_exists():
+            self._overlay.lift()
+            return
+        window = tk.Toplevel(self._root)
+        window.title("UI-Profil")
+        window.geometry("700x300")
+        window.attributes('-topmost', True)
+        stall_var = tk.StringVar()
+        ttk.Label(window, textvariable=stall_var).pack(anchor="w", padx=5)
+
+        columns = ("name", "count", "max_ms", "total_ms", "db_ms")
+        tree = ttk.Treeview(window, columns=columns, show="headings")
+        for column, text, width in (("name", "Aktion", 330), ("count", "Anzahl", 60),
+                                    ("max_ms", "Max (ms)", 90), ("total_ms", "Summe (ms)", 100),
+                                    ("db_ms", "DB (ms)", 90)):
+            tree.heading(column, text=text)
+            tree.column(column, width=width)
+        tree.pack(fill="both", expand=True)
+        ttk.Button(window, text="Als JSON speichern", command=self.dump).pack(pady=5)
+
+        def refresh():
+            if not window.winfo_exists():
+                return
+            report = self.report()
+            stall_var.set(f"Blockiert gesamt: {report['stall_total_ms']:.0f} ms "
+                          f"({len(report['stalls'])} Hänger)")
+            tree.delete(*tree.get_children())
+            for total in report['actions'][:50]:
+                tree.insert("", "end", values=(total['name'], total['count'], f"{total['max_ms']:.1f}",
+                                               f"{total['total_ms']:.1f}", f"{total['db_ms']:.1f}"))
+            self._originals[(tk.Misc, 'after')](window, 1000, refresh)
+
+        self._overlay = window
+        refresh()
+
+
+def install_from_env():
+    """Install the profiler once if TASSEN_UI_PROFILE is set; returns it or None"""
+    global _profiler
+    if not PROFILE_MODE or PROFILE_MODE == '0':
+        return None
+    if _profiler is None:
+        _profiler = UIProfiler(use_cprofile=PROFILE_MODE.lower() == 'cprofile')
+        _profiler.install()
+    return _profiler